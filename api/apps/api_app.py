@@ -534,13 +534,13 @@ def list_chunks():
             )
         kb_ids = KnowledgebaseService.get_kb_ids(tenant_id)
 
-        res = settings.retrievaler.chunk_list(doc_id, tenant_id, kb_ids)
+        # every chunk of the document, not the first page chunk_list is capped to
         res = [
             {
                 "content": res_item["content_with_weight"],
                 "doc_name": res_item["docnm_kwd"],
                 "image_id": res_item["img_id"]
-            } for res_item in res
+            } for res_item in settings.retrievaler.iter_chunks(doc_id, tenant_id, kb_ids)
         ]
 
     except Exception as e:
@@ -13,12 +13,22 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import base64
 import json
 import logging
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import xxhash
 
 from api.utils.file_utils import get_project_base_directory
 from rag.llm import EmbeddingModel, CvModel, ChatModel, RerankModel, Seq2txtModel, TTSModel
+from rag.llm.cv_model import fit_image
+from rag.utils.redis_conn import REDIS_CONN
 from api.db import LLMType
 from api.db.db_models import DB
 from api.db.db_models import LLMFactories, LLM, TenantLLM
@@ -253,17 +263,46 @@ class TenantLLMService(CommonService):
         return list(objs)
 
 
+IMAGE2TEXT_CONCURRENCY = int(os.environ.get("IMAGE2TEXT_CONCURRENCY", "8"))
+SEQ2TXT_CONCURRENCY = int(os.environ.get("SEQ2TXT_CONCURRENCY", "4"))
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", "4096"))
+QUERY_EMBEDDING_CACHE_TTL = int(os.environ.get("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+QUERY_EMBEDDING_CACHE_REDIS = os.environ.get("QUERY_EMBEDDING_CACHE_REDIS", "1") == "1"
+
+# query embeddings by model and text, shared by the LLMBundles of the process
+_query_embeddings = OrderedDict()
+_query_embeddings_lock = threading.Lock()
+_query_embeddings_stats = {"hits": 0, "redis_hits": 0, "misses": 0}
+
+
+def query_embedding_cache_info():
+    """Hits of the process cache, hits of Redis and misses of both, which went to the model."""
+    with _query_embeddings_lock:
+        info = dict(_query_embeddings_stats)
+        info["size"] = len(_query_embeddings)
+    total = info["hits"] + info["redis_hits"] + info["misses"]
+    info["hit_rate"] = (info["hits"] + info["redis_hits"]) / total if total else 0.0
+    return info
+
+
+def _cacheable(txt):
+    return isinstance(txt, str) and bool(txt.strip()) and not txt.startswith("**ERROR**")
+
+
 class LLMBundle(object):
     def __init__(self, tenant_id, llm_type, llm_name=None, lang="Chinese"):
         self.tenant_id = tenant_id
         self.llm_type = llm_type
         self.llm_name = llm_name
+        self.lang = lang
         self.mdl = TenantLLMService.model_instance(
             tenant_id, llm_type, llm_name, lang=lang)
         assert self.mdl, "Can't find model for {}/{}/{}".format(
             tenant_id, llm_type, llm_name)
         model_config = TenantLLMService.get_model_config(tenant_id, llm_type, llm_name)
         self.max_length = model_config.get("max_tokens", 8192)
+        self.model_name = model_config.get("llm_name", llm_name)
+        self.llm_factory = model_config.get("llm_factory")
 
     def encode(self, texts: list):
         embeddings, used_tokens = self.mdl.encode(texts)
@@ -274,6 +313,53 @@ class LLMBundle(object):
         return embeddings, used_tokens
 
     def encode_queries(self, query: str):
+        """
+        Embeds `query`, looking it up first in the process cache, then in Redis.
+        Both keep an embedding for QUERY_EMBEDDING_CACHE_TTL seconds, keyed by
+        tenant, factory, model and text. A cached embedding costs no tokens.
+        """
+        if QUERY_EMBEDDING_CACHE_SIZE <= 0:
+            return self._encode_queries(query)
+        hasher = xxhash.xxh64()
+        for part in [self.tenant_id, self.llm_factory, self.model_name, query]:
+            hasher.update(str(part).encode("utf-8"))
+            hasher.update(b"\0")
+        k = "query_embedding:" + hasher.hexdigest()
+
+        with _query_embeddings_lock:
+            cached = _query_embeddings.get(k)
+            if cached and time.time() - cached[0] < QUERY_EMBEDDING_CACHE_TTL:
+                _query_embeddings.move_to_end(k)
+                _query_embeddings_stats["hits"] += 1
+                return cached[1].copy(), 0
+
+        emd = None
+        if QUERY_EMBEDDING_CACHE_REDIS:
+            # responses of REDIS_CONN are decoded, so the array goes as "dtype:base64"
+            value = REDIS_CONN.get(k)
+            if value:
+                dtype, data = value.split(":", 1)
+                emd = np.frombuffer(base64.b64decode(data), dtype=dtype)
+        with _query_embeddings_lock:
+            _query_embeddings_stats["redis_hits" if emd is not None else "misses"] += 1
+        used_tokens = 0
+        if emd is None:
+            emd, used_tokens = self._encode_queries(query)
+            emd = np.asarray(emd)
+            if emd.ndim != 1:
+                return emd, used_tokens
+            if QUERY_EMBEDDING_CACHE_REDIS:
+                REDIS_CONN.set(k, emd.dtype.str + ":" + base64.b64encode(emd.tobytes()).decode("ascii"),
+                               QUERY_EMBEDDING_CACHE_TTL)
+
+        with _query_embeddings_lock:
+            _query_embeddings[k] = (time.time(), emd)
+            _query_embeddings.move_to_end(k)
+            while len(_query_embeddings) > QUERY_EMBEDDING_CACHE_SIZE:
+                _query_embeddings.popitem(last=False)
+        return emd.copy(), used_tokens
+
+    def _encode_queries(self, query: str):
         emd, used_tokens = self.mdl.encode_queries(query)
         if not TenantLLMService.increase_usage(
                 self.tenant_id, self.llm_type, used_tokens):
@@ -297,6 +383,70 @@ class LLMBundle(object):
                 "LLMBundle.describe can't update token usage for {}/IMAGE2TEXT used_tokens: {}".format(self.tenant_id, used_tokens))
         return txt
 
+    def _batch(self, name, binaries, func, concurrency, salt=(), callback=None):
+        """
+        Runs `func` on every distinct binary with at most `concurrency` calls in
+        flight. Results are cached in Redis for a day, keyed by tenant, factory,
+        model, `salt` and content, so identical inputs, in the batch or in a
+        former one, are sent once. `salt` lists whatever else changes the
+        output, such as the language of the prompt. Empty results and the
+        "**ERROR**" answers models give instead of raising aren't cached.
+        Returns the results in the order of `binaries`.
+        """
+        parts = [self.tenant_id, self.llm_factory, type(self.mdl).__name__, self.model_name, *salt]
+        keys = []
+        for binary in binaries:
+            hasher = xxhash.xxh64()
+            for part in parts:
+                hasher.update(str(part).encode("utf-8"))
+                hasher.update(b"\0")
+            hasher.update(binary)
+            keys.append(name + ":" + hasher.hexdigest())
+
+        answers = {}
+        todo = {}
+        for k, binary in zip(keys, binaries):
+            if k in answers or k in todo:
+                continue
+            cached = REDIS_CONN.get(k)
+            if _cacheable(cached):
+                answers[k] = cached
+            else:
+                todo[k] = binary
+
+        def run(k):
+            try:
+                txt = func(todo[k])
+            except Exception:
+                REDIS_CONN.delete(k)
+                raise
+            if _cacheable(txt):
+                REDIS_CONN.set(k, txt, 24 * 3600)
+            else:
+                REDIS_CONN.delete(k)
+            return txt
+
+        if todo:
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(todo))) as executor:
+                futures = {k: executor.submit(run, k) for k in todo}
+                for i, (k, f) in enumerate(futures.items()):
+                    answers[k] = f.result()
+                    if callback:
+                        callback(msg="{}: {}/{} done.".format(name, i + 1, len(futures)))
+        logging.info("LLMBundle.{} {} inputs, {} sent, {} cached".format(
+            name, len(binaries), len(todo), len(set(keys)) - len(todo)))
+        return [answers[k] for k in keys]
+
+    def describe_batch(self, images, max_tokens=300, callback=None):
+        """
+        Describes the images with at most IMAGE2TEXT_CONCURRENCY requests in
+        flight. Every image is downscaled by `fit_image` before upload.
+        """
+        return self._batch("image2text", [fit_image(img) for img in images],
+                           lambda binary: self.describe(binary, max_tokens),
+                           IMAGE2TEXT_CONCURRENCY, salt=(getattr(self.mdl, "lang", self.lang), max_tokens),
+                           callback=callback)
+
     def transcription(self, audio):
         txt, used_tokens = self.mdl.transcription(audio)
         if not TenantLLMService.increase_usage(
@@ -305,6 +455,11 @@ class LLMBundle(object):
                 "LLMBundle.transcription can't update token usage for {}/SEQUENCE2TXT used_tokens: {}".format(self.tenant_id, used_tokens))
         return txt
 
+    def transcription_batch(self, audios, callback=None):
+        """Transcribes the audio segments with at most SEQ2TXT_CONCURRENCY requests in flight."""
+        return self._batch("seq2txt", audios, self.transcription, SEQ2TXT_CONCURRENCY,
+                           salt=(getattr(self.mdl, "lang", self.lang),), callback=callback)
+
     def tts(self, text):
         for chunk in self.mdl.tts(text):
             if isinstance(chunk, int):
@@ -41,6 +41,7 @@ from api.db.db_models import init_database_tables as init_web_db
 from api.db.init_data import init_web_data
 from api.versions import get_ragflow_version
 from api.utils import show_configs
+from api.validation import resource_validation
 from rag.settings import print_rag_settings
 
 stop_event = threading.Event()
@@ -70,6 +71,7 @@ def create_app():
     show_configs()
     settings.init_settings()
     print_rag_settings()
+    resource_validation()
 
     # 初始化数据库
     init_web_db()
@@ -15,6 +15,7 @@
 #
 
 import logging
+import os
 import sys
 
 
@@ -33,17 +34,48 @@ def python_version_validation():
 python_version_validation()
 
 
-# Download nltk data
-def download_nltk_data():
-    import nltk
-    nltk.download('wordnet', halt_on_error=False, quiet=True)
-    nltk.download('punkt_tab', halt_on_error=False, quiet=True)
+# Files the services load, relative to the project base directory. Any one of
+# the files in a tuple will do.
+RESOURCES = {
+    "tokenizer dictionary": [("rag/res/huqie.txt.trie", "rag/res/huqie.txt")],
+    "OCR models": ["rag/res/deepdoc/det.onnx", "rag/res/deepdoc/rec.onnx", "rag/res/deepdoc/ocr.res"],
+    "layout models": ["rag/res/deepdoc/layout.onnx", "rag/res/deepdoc/tsr.onnx",
+                      "rag/res/deepdoc/updown_concat_xgb.model"],
+}
+NLTK_RESOURCES = ["tokenizers/punkt_tab", "corpora/wordnet"]
+
 
+def resource_validation():
+    """
+    Checks that the models and data files are on disk, strictly offline: it
+    never downloads, so a missing resource is only reported here and fetched,
+    if at all, where it is first used. Run download_deps.py to fetch them.
+    Returns the names of the missing resources.
+    """
+    import hashlib
+    import nltk
+    from api.utils.file_utils import get_project_base_directory
 
-try:
-    from multiprocessing import Pool
-    pool = Pool(processes=1)
-    thread = pool.apply_async(download_nltk_data)
-    binary = thread.get(timeout=60)
-except Exception:
-    print('\x1b[6;37;41m WARNING \x1b[0m' + "Downloading NLTK data failure.", flush=True)
+    base = get_project_base_directory()
+    missing = []
+    for name, files in RESOURCES.items():
+        absent = [f for f in files if not any([os.path.exists(os.path.join(base, ff))
+                                                 for ff in (f if isinstance(f, tuple) else [f])])]
+        if absent:
+            missing.append(name)
+            logging.warning(f"Missing {name}: {', '.join([' or '.join(f) if isinstance(f, tuple) else f for f in absent])}")
+    for res in NLTK_RESOURCES:
+        try:
+            nltk.data.find(res)
+        except LookupError:
+            missing.append(f"nltk {res}")
+            logging.warning(f"Missing nltk data {res} in {nltk.data.path}")
+    # tiktoken caches its encodings under the sha1 of their url
+    url = "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken"
+    tiktoken_file = os.path.join(os.environ.get("TIKTOKEN_CACHE_DIR", base), hashlib.sha1(url.encode()).hexdigest())
+    if not os.path.exists(tiktoken_file):
+        missing.append("tiktoken cl100k_base")
+        logging.warning(f"Missing tiktoken encoding {tiktoken_file}")
+    if not missing:
+        logging.info("All resources are available offline")
+    return missing
@@ -14,13 +14,26 @@
 #  limitations under the License.
 #
 
-from docx import Document
+from docx.oxml.parser import element_class_lookup
+from docx.styles import BabelFish
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+from lxml import etree
+import posixpath
 import re
+import zipfile
 import pandas as pd
 from collections import Counter
 from rag.nlp import rag_tokenizer
 from io import BytesIO
 
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+RELS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+
+def _qn(ns, tag):
+    return "{%s}%s" % (ns, tag)
+
 
 class RAGFlowDocxParser:
 
@@ -114,26 +127,100 @@ class RAGFlowDocxParser:
         return ["\n".join(lines)]
 
     def __call__(self, fnm, from_page=0, to_page=100000000):
-        self.doc = Document(fnm) if isinstance(
-            fnm, str) else Document(BytesIO(fnm))
-        pn = 0 # parsed page
         secs = [] # parsed contents
-        for p in self.doc.paragraphs:
-            if pn > to_page:
-                break
-
-            runs_within_single_paragraph = [] # save runs within the range of pages
-            for run in p.runs:
-                if pn > to_page:
-                    break
-                if from_page <= pn < to_page and p.text.strip():
-                    runs_within_single_paragraph.append(run.text) # append run.text first
-
-                # wrap page break checker into a static method
-                if 'lastRenderedPageBreak' in run._element.xml:
-                    pn += 1
-
-            secs.append(("".join(runs_within_single_paragraph), p.style.name if hasattr(p.style, 'name') else '')) # then concat run.text as part of the paragraph
-
-        tbls = [self.__extract_table_content(tb) for tb in self.doc.tables]
+        tbls = []
+        for kind, sec in self.iter_sections(fnm, from_page, to_page):
+            if kind == "table":
+                tbls.append(sec)
+            else:
+                secs.append(sec)
         return secs, tbls
+
+    @staticmethod
+    def _rels(zf, part, key="Type"):
+        """Maps relationship types (or ids, with key="Id") of a package part to the paths of their targets."""
+        rels = posixpath.join(posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels")
+        if rels not in zf.namelist():
+            return {}
+        res = {}
+        for rel in etree.fromstring(zf.read(rels)).iter(_qn(RELS_NS, "Relationship")):
+            target = rel.get("Target")
+            target = target.lstrip("/") if target.startswith("/") else \
+                posixpath.normpath(posixpath.join(posixpath.dirname(part), target))
+            res[rel.get(key).split("/")[-1]] = target
+        return res
+
+    @staticmethod
+    def _paragraph_styles(zf, part):
+        """Paragraph style names by style id, the default one under None, as python-docx names them."""
+        styles = RAGFlowDocxParser._rels(zf, part).get("styles")
+        names = {}
+        if not styles or styles not in zf.namelist():
+            return names
+        for st in etree.fromstring(zf.read(styles)).iter(_qn(W_NS, "style")):
+            if st.get(_qn(W_NS, "type")) != "paragraph":
+                continue
+            name = st.find(_qn(W_NS, "name"))
+            name = BabelFish.internal2ui(name.get(_qn(W_NS, "val"))) if name is not None else None
+            names[st.get(_qn(W_NS, "styleId"))] = name
+            if st.get(_qn(W_NS, "default")) in ("1", "true", "on"):
+                # unknown or missing style ids fall back to the last default style
+                names[None] = name
+        return names
+
+    def iter_body(self, fnm, with_images=False):
+        """
+        Reads the body paragraphs and tables one at a time from the document XML,
+        dropping each once yielded, instead of loading the whole document tree.
+        Yields ("paragraph", Paragraph, style name, images) and ("table", Table,
+        None, []) in document order, where images are the bytes of the pictures
+        in the paragraph, read only with `with_images`. The elements have no
+        parent part, so they only serve to read text, runs and cells.
+        """
+        with zipfile.ZipFile(fnm if isinstance(fnm, str) else BytesIO(fnm)) as zf:
+            part = RAGFlowDocxParser._rels(zf, "").get("officeDocument", "word/document.xml")
+            styles = RAGFlowDocxParser._paragraph_styles(zf, part)
+            media = RAGFlowDocxParser._rels(zf, part, key="Id") if with_images else {}
+            names = set(zf.namelist())
+            body = _qn(W_NS, "body")
+            with zf.open(part) as f:
+                it = etree.iterparse(f, events=("end",), tag=(_qn(W_NS, "p"), _qn(W_NS, "tbl")))
+                it.set_element_class_lookup(element_class_lookup)
+                for _, el in it:
+                    parent = el.getparent()
+                    if parent is None or parent.tag != body:
+                        continue
+                    if el.tag == _qn(W_NS, "tbl"):
+                        yield "table", Table(el, None), None, []
+                    else:
+                        images = []
+                        if with_images:
+                            for rid in el.xpath(".//pic:pic//a:blip/@r:embed"):
+                                if media.get(rid) in names:
+                                    images.append(zf.read(media[rid]))
+                        style = styles[el.style] if el.style in styles else styles.get(None, '')
+                        yield "paragraph", Paragraph(el, None), style, images
+                    # drop what has been yielded
+                    el.clear()
+                    while el.getprevious() is not None:
+                        del parent[0]
+
+    def iter_sections(self, fnm, from_page=0, to_page=100000000):
+        """
+        Yields the sections __call__ returns as they are read, see iter_body:
+        ("paragraph", (text, style)) and ("table", lines) in document order.
+        """
+        pn = 0 # parsed page
+        for kind, el, style, _ in self.iter_body(fnm):
+            if kind == "table":
+                yield "table", self.__extract_table_content(el)
+            elif pn <= to_page:
+                runs_within_single_paragraph = [] # save runs within the range of pages
+                for run in el.runs:
+                    if pn > to_page:
+                        break
+                    if from_page <= pn < to_page and el.text.strip():
+                        runs_within_single_paragraph.append(run.text)
+                    if 'lastRenderedPageBreak' in run._element.xml:
+                        pn += 1
+                yield "paragraph", ("".join(runs_within_single_paragraph), style)
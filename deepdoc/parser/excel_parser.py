@@ -23,9 +23,9 @@ import pandas as pd
 
 class RAGFlowExcelParser:
     @staticmethod
-    def _load_excel_to_workbook(file_like_object):
+    def _load_excel_to_workbook(file_like_object, read_only=False):
         try:
-            return load_workbook(file_like_object)
+            return load_workbook(file_like_object, read_only=read_only)
         except Exception as e:
             logging.info(f"****wxy: openpyxl load error: {e}, try pandas instead")
             try:
@@ -42,74 +42,89 @@ class RAGFlowExcelParser:
             except Exception as e_pandas:
                 raise Exception(f"****wxy: pandas read error: {e_pandas}, original openpyxl error: {e}")
 
-    def html(self, fnm, chunk_rows=256):
+    @staticmethod
+    def _sheet_size(ws):
+        """
+        Returns the number of rows and columns of the worksheet, counted by
+        scanning its rows. Read-only worksheets would otherwise take them from
+        the dimension record of the file, which writers often leave stale.
+        """
+        if hasattr(ws, "reset_dimensions"):
+            ws.reset_dimensions()
+        n_rows, n_cols = 0, 0
+        for i, r in enumerate(ws.iter_rows(), 1):
+            if r:
+                n_rows, n_cols = i, max(n_cols, r[-1].column)
+        return n_rows, n_cols
+
+    @staticmethod
+    def iter_sheets(fnm):
+        """
+        Yields (sheetname, rows) for every worksheet, where rows is an iterator
+        of value tuples read from a read-only workbook, so that memory stays bounded
+        whatever the size of the workbook. Rows are padded to the width of the sheet.
+        """
         file_like_object = BytesIO(fnm) if not isinstance(fnm, str) else fnm
-        wb = RAGFlowExcelParser._load_excel_to_workbook(file_like_object)
-        tb_chunks = []
-        for sheetname in wb.sheetnames:
-            ws = wb[sheetname]
-            rows = list(ws.rows)
-            if not rows:
+        wb = RAGFlowExcelParser._load_excel_to_workbook(file_like_object, read_only=True)
+        try:
+            for sheetname in wb.sheetnames:
+                ws = wb[sheetname]
+                n_rows, n_cols = RAGFlowExcelParser._sheet_size(ws)
+                if not n_rows:
+                    continue
+                yield sheetname, ws.iter_rows(max_row=n_rows, max_col=n_cols, values_only=True)
+        finally:
+            wb.close()
+
+    def html_iter(self, fnm, chunk_rows=256):
+        for sheetname, rows in self.iter_sheets(fnm):
+            headers = next(rows, None)
+            if headers is None:
                 continue
+            tb_rows_0 = "<tr>" + "".join([f"<th>{v}</th>" for v in headers]) + "</tr>"
+
+            tb, n = [], 0
+            for r in rows:
+                tb.append("<tr>" + "".join(["<td></td>" if v is None else f"<td>{v}</td>" for v in r]) + "</tr>")
+                if len(tb) >= chunk_rows:
+                    yield f"<table><caption>{sheetname}</caption>" + tb_rows_0 + "".join(tb) + "</table>\n"
+                    tb = []
+                    n += 1
+            if tb or not n:
+                yield f"<table><caption>{sheetname}</caption>" + tb_rows_0 + "".join(tb) + "</table>\n"
 
-            tb_rows_0 = "<tr>"
-            for t in list(rows[0]):
-                tb_rows_0 += f"<th>{t.value}</th>"
-            tb_rows_0 += "</tr>"
-
-            for chunk_i in range((len(rows) - 1) // chunk_rows + 1):
-                tb = ""
-                tb += f"<table><caption>{sheetname}</caption>"
-                tb += tb_rows_0
-                for r in list(
-                  rows[1 + chunk_i * chunk_rows: 1 + (chunk_i + 1) * chunk_rows]
-                ):
-                    tb += "<tr>"
-                    for i, c in enumerate(r):
-                        if c.value is None:
-                            tb += "<td></td>"
-                        else:
-                            tb += f"<td>{c.value}</td>"
-                    tb += "</tr>"
-                tb += "</table>\n"
-                tb_chunks.append(tb)
-
-        return tb_chunks
-
-    def __call__(self, fnm):
-        file_like_object = BytesIO(fnm) if not isinstance(fnm, str) else fnm
-        wb = RAGFlowExcelParser._load_excel_to_workbook(file_like_object)
+    def html(self, fnm, chunk_rows=256):
+        return list(self.html_iter(fnm, chunk_rows))
 
-        res = []
-        for sheetname in wb.sheetnames:
-            ws = wb[sheetname]
-            rows = list(ws.rows)
-            if not rows:
+    def iter_lines(self, fnm):
+        for sheetname, rows in self.iter_sheets(fnm):
+            ti = next(rows, None)
+            if ti is None:
                 continue
-            ti = list(rows[0])
-            for r in list(rows[1:]):
+            for r in rows:
                 fields = []
-                for i, c in enumerate(r):
-                    if not c.value:
+                for i, v in enumerate(r):
+                    if not v:
                         continue
-                    t = str(ti[i].value) if i < len(ti) else ""
-                    t += ("：" if t else "") + str(c.value)
+                    t = str(ti[i]) if i < len(ti) else ""
+                    t += ("：" if t else "") + str(v)
                     fields.append(t)
                 line = "; ".join(fields)
                 if sheetname.lower().find("sheet") < 0:
                     line += " ——" + sheetname
-                res.append(line)
-        return res
+                yield line
+
+    def __call__(self, fnm):
+        return list(self.iter_lines(fnm))
 
     @staticmethod
     def row_number(fnm, binary):
         if fnm.split(".")[-1].lower().find("xls") >= 0:
-            wb = RAGFlowExcelParser._load_excel_to_workbook(BytesIO(binary))
-            total = 0
-            for sheetname in wb.sheetnames:
-                ws = wb[sheetname]
-                total += len(list(ws.rows))
-            return total
+            wb = RAGFlowExcelParser._load_excel_to_workbook(BytesIO(binary), read_only=True)
+            try:
+                return sum([RAGFlowExcelParser._sheet_size(wb[sheetname])[0] for sheetname in wb.sheetnames])
+            finally:
+                wb.close()
 
         if fnm.split(".")[-1].lower() in ["csv", "txt"]:
             encoding = find_codec(binary)
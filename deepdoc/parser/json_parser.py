@@ -19,9 +19,143 @@
 # from https://github.com/langchain-ai/langchain/blob/master/libs/text-splitters/langchain_text_splitters/json.py
 
 import json
+import re
 from typing import Any
 
+from deepdoc.parser.utils import iter_text
 from rag.nlp import find_codec
+
+
+class JsonStreamReader:
+    """
+    Pull parser over blocks of decoded JSON text.
+
+    A container whose text fits in `buffer_limit` characters is decoded at once
+    and comes out as ("value", path, value). A larger one is entered instead:
+    it comes out as ("start", path, bracket), followed by the events of its
+    members and ("end", path, bracket), so that only one member at the depth
+    being read is buffered at a time. Array members are keyed by their index
+    as a string, the way _list_to_dict_preprocessing keys them.
+    """
+
+    _WHITESPACE = re.compile(r"[ \t\n\r]*")
+    _STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.S)
+    _SCALAR_END = re.compile(r"[,\]}\s]")
+    _TOKEN = re.compile(r'["\[\]{}]')
+
+    def __init__(self, texts, buffer_limit):
+        self.texts = iter(texts)
+        self.buffer_limit = buffer_limit
+        self.buf = ""
+        self.pos = 0
+
+    def _fill(self):
+        txt = next(self.texts, None)
+        if txt is None:
+            return False
+        self.buf = self.buf[self.pos:] + txt
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        while True:
+            self.pos = self._WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return None
+
+    def _expect(self, chars):
+        c = self._peek()
+        if c is None or c not in chars:
+            raise ValueError(f"Expecting one of '{chars}' but got {c!r}")
+        self.pos += 1
+        return c
+
+    def _string_len(self):
+        while True:
+            m = self._STRING.match(self.buf, self.pos)
+            if m:
+                return m.end() - self.pos
+            if not self._fill():
+                raise ValueError("Unterminated string in JSON")
+
+    def _value_len(self, limit):
+        """Length of the value at the current position, None for a container longer than limit."""
+        c = self.buf[self.pos]
+        if c == '"':
+            return self._string_len()
+        if c not in "[{":
+            while True:
+                m = self._SCALAR_END.search(self.buf, self.pos)
+                if m:
+                    return m.start() - self.pos
+                if not self._fill():
+                    return len(self.buf) - self.pos
+
+        depth, rel = 0, 0
+        while True:
+            m = self._TOKEN.search(self.buf, self.pos + rel)
+            if m and m.group() == '"':
+                s = self._STRING.match(self.buf, m.start())
+                if s:
+                    rel = s.end() - self.pos
+                    continue
+                rel = m.start() - self.pos
+            elif m:
+                depth += 1 if m.group() in "[{" else -1
+                rel = m.end() - self.pos
+                if depth == 0:
+                    return rel
+                continue
+            else:
+                rel = len(self.buf) - self.pos
+            if len(self.buf) - self.pos > limit:
+                return None
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON")
+
+    def events(self):
+        yield from self._events([])
+        if self._peek() is not None:
+            raise ValueError("Extra data after JSON")
+
+    def _events(self, path):
+        c = self._peek()
+        if c is None:
+            raise ValueError("Unexpected end of JSON")
+        n = self._value_len(self.buffer_limit)
+        if n is not None:
+            value = json.loads(self.buf[self.pos: self.pos + n])
+            self.pos += n
+            yield "value", path, value
+            return
+
+        yield "start", path, c
+        self.pos += 1
+        close = "}" if c == "{" else "]"
+        if self._peek() == close:
+            self.pos += 1
+            yield "end", path, c
+            return
+        i = 0
+        while True:
+            if c == "{":
+                if self._peek() != '"':
+                    raise ValueError("Expecting property name enclosed in double quotes")
+                n = self._string_len()
+                key = json.loads(self.buf[self.pos: self.pos + n])
+                self.pos += n
+                self._expect(":")
+            else:
+                key = str(i)
+                i += 1
+            yield from self._events(path + [key])
+            if self._expect("," + close) == close:
+                break
+        yield "end", path, c
+
+
 class RAGFlowJsonParser:
     def __init__(
         self, max_chunk_size: int = 2000, min_chunk_size: int | None = None
@@ -42,6 +176,41 @@ class RAGFlowJsonParser:
         sections = [json.dumps(line, ensure_ascii=False) for line in chunks if line]
         return sections
 
+    def iter_sections(self, binary):
+        """
+        Streaming counterpart of __call__ for large files: the text is decoded
+        block by block, read by JsonStreamReader and every chunk is yielded as
+        soon as the next one is started. Containers too large to be buffered are
+        taken as too large for a chunk, which is what __call__ decides as well
+        unless the container is almost only whitespace.
+        """
+        reader = JsonStreamReader(iter_text("", binary), max(64 * self.max_chunk_size, 1 << 16))
+        for chunk in self.split_json_events(reader.events()):
+            if chunk:
+                yield json.dumps(chunk, ensure_ascii=False)
+
+    def split_json_events(self, events):
+        """Same splitting as split_json(..., convert_lists=True) over the events of JsonStreamReader."""
+        chunk = {}
+        for ev, path, value in events:
+            if ev == "end":
+                continue
+            if not path:
+                if ev == "value":
+                    yield from self.split_json(value, True)
+                continue
+            if ev == "start":
+                if self._json_size(chunk) >= self.min_chunk_size:
+                    yield chunk
+                    chunk = {}
+                continue
+            # run the splitting loop for this single member against the current chunk
+            chunks = self._json_split({path[-1]: self._list_to_dict_preprocessing(value)}, path[:-1], [chunk])
+            yield from chunks[:-1]
+            chunk = chunks[-1]
+        if chunk:
+            yield chunk
+
     @staticmethod
     def _json_size(data: dict) -> int:
         """Calculate the size of the serialized JSON object."""
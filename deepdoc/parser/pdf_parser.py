@@ -21,7 +21,6 @@ from timeit import default_timer as timer
 import sys
 import threading
 
-import xgboost as xgb
 from io import BytesIO
 import re
 import pdfplumber
@@ -32,6 +31,7 @@ from pypdf import PdfReader as pdf2_read
 from api import settings
 from api.utils.file_utils import get_project_base_directory
 from deepdoc.vision import OCR, Recognizer, LayoutRecognizer, TableStructureRecognizer
+from deepdoc.parser.profiler import profile_stage, profiled
 from rag.nlp import rag_tokenizer
 from copy import deepcopy
 from huggingface_hub import snapshot_download
@@ -41,6 +41,9 @@ if LOCK_KEY_pdfplumber not in sys.modules:
     sys.modules[LOCK_KEY_pdfplumber] = threading.Lock()
 
 class RAGFlowPdfParser:
+    # Set to a deepdoc.parser.profiler.PdfProfiler to record per-stage costs.
+    profiler = None
+
     def __init__(self):
         """
         If you have trouble downloading HuggingFace models, -_^ this might help!!
@@ -60,6 +63,7 @@ class RAGFlowPdfParser:
             self.layouter = LayoutRecognizer("layout")
         self.tbl_det = TableStructureRecognizer()
 
+        import xgboost as xgb
         self.updown_cnt_mdl = xgb.Booster()
         if not settings.LIGHTEN:
             try:
@@ -192,6 +196,7 @@ class RAGFlowPdfParser:
                     return False
         return True
 
+    @profiled("table_structure", lambda self: len(self.tb_cpns))
     def _table_transformer_job(self, ZM):
         logging.debug("Table processing...")
         imgs, pos = [], []
@@ -285,55 +290,61 @@ class RAGFlowPdfParser:
 
     def __ocr(self, pagenum, img, chars, ZM=3):
         start = timer()
-        bxs = self.ocr.detect(np.array(img))
+        with profile_stage(self.profiler, "ocr_detect", self.page_from + pagenum) as rec:
+            bxs = self.ocr.detect(np.array(img))
+            rec["boxes"] = len(bxs) if bxs else 0
         logging.info(f"__ocr detecting boxes of a image cost ({timer() - start}s)")
 
         start = timer()
         if not bxs:
             self.boxes.append([])
             return
-        bxs = [(line[0], line[1][0]) for line in bxs]
-        bxs = Recognizer.sort_Y_firstly(
-            [{"x0": b[0][0] / ZM, "x1": b[1][0] / ZM,
-              "top": b[0][1] / ZM, "text": "", "txt": t,
-              "bottom": b[-1][1] / ZM,
-              "page_number": pagenum} for b, t in bxs if b[0][0] <= b[1][0] and b[0][1] <= b[-1][1]],
-            self.mean_height[-1] / 3
-        )
-        
-        # merge chars in the same rect
-        for c in Recognizer.sort_Y_firstly(
-                chars, self.mean_height[pagenum - 1] // 4):
-            ii = Recognizer.find_overlapped(c, bxs)
-            if ii is None:
-                self.lefted_chars.append(c)
-                continue
-            ch = c["bottom"] - c["top"]
-            bh = bxs[ii]["bottom"] - bxs[ii]["top"]
-            if abs(ch - bh) / max(ch, bh) >= 0.7 and c["text"] != ' ':
-                self.lefted_chars.append(c)
-                continue
-            if c["text"] == " " and bxs[ii]["text"]:
-                if re.match(r"[0-9a-zA-Zа-яА-Я,.?;:!%%]", bxs[ii]["text"][-1]):
-                    bxs[ii]["text"] += " "
-            else:
-                bxs[ii]["text"] += c["text"]
+        with profile_stage(self.profiler, "ocr_merge_chars", self.page_from + pagenum) as rec:
+            bxs = [(line[0], line[1][0]) for line in bxs]
+            bxs = Recognizer.sort_Y_firstly(
+                [{"x0": b[0][0] / ZM, "x1": b[1][0] / ZM,
+                  "top": b[0][1] / ZM, "text": "", "txt": t,
+                  "bottom": b[-1][1] / ZM,
+                  "page_number": pagenum} for b, t in bxs if b[0][0] <= b[1][0] and b[0][1] <= b[-1][1]],
+                self.mean_height[-1] / 3
+            )
+
+            # merge chars in the same rect
+            for c in Recognizer.sort_Y_firstly(
+                    chars, self.mean_height[pagenum - 1] // 4):
+                ii = Recognizer.find_overlapped(c, bxs)
+                if ii is None:
+                    self.lefted_chars.append(c)
+                    continue
+                ch = c["bottom"] - c["top"]
+                bh = bxs[ii]["bottom"] - bxs[ii]["top"]
+                if abs(ch - bh) / max(ch, bh) >= 0.7 and c["text"] != ' ':
+                    self.lefted_chars.append(c)
+                    continue
+                if c["text"] == " " and bxs[ii]["text"]:
+                    if re.match(r"[0-9a-zA-Zа-яА-Я,.?;:!%%]", bxs[ii]["text"][-1]):
+                        bxs[ii]["text"] += " "
+                else:
+                    bxs[ii]["text"] += c["text"]
+            rec["boxes"] = len(bxs)
 
         logging.info(f"__ocr sorting {len(chars)} chars cost {timer() - start}s")
         start = timer()
-        boxes_to_reg = []
-        img_np = np.array(img)
-        for b in bxs:
-            if not b["text"]:
-                left, right, top, bott = b["x0"] * ZM, b["x1"] * \
-                                         ZM, b["top"] * ZM, b["bottom"] * ZM
-                b["box_image"] = self.ocr.get_rotate_crop_image(img_np, np.array([[left, top], [right, top], [right, bott], [left, bott]], dtype=np.float32))
-                boxes_to_reg.append(b)
-            del b["txt"]
-        texts = self.ocr.recognize_batch([b["box_image"] for b in boxes_to_reg])
-        for i in range(len(boxes_to_reg)):
-            boxes_to_reg[i]["text"] = texts[i]
-            del boxes_to_reg[i]["box_image"]
+        with profile_stage(self.profiler, "ocr_recognize", self.page_from + pagenum) as rec:
+            boxes_to_reg = []
+            img_np = np.array(img)
+            for b in bxs:
+                if not b["text"]:
+                    left, right, top, bott = b["x0"] * ZM, b["x1"] * \
+                                             ZM, b["top"] * ZM, b["bottom"] * ZM
+                    b["box_image"] = self.ocr.get_rotate_crop_image(img_np, np.array([[left, top], [right, top], [right, bott], [left, bott]], dtype=np.float32))
+                    boxes_to_reg.append(b)
+                del b["txt"]
+            texts = self.ocr.recognize_batch([b["box_image"] for b in boxes_to_reg])
+            for i in range(len(boxes_to_reg)):
+                boxes_to_reg[i]["text"] = texts[i]
+                del boxes_to_reg[i]["box_image"]
+            rec["boxes"] = len(boxes_to_reg)
         logging.info(f"__ocr recognize {len(bxs)} boxes cost {timer() - start}s")
         bxs = [b for b in bxs if b["text"]]
         if self.mean_height[-1] == 0:
@@ -341,6 +352,7 @@ class RAGFlowPdfParser:
                                               for b in bxs])
         self.boxes.append(bxs)
 
+    @profiled("layout", lambda self: len(self.boxes))
     def _layouts_rec(self, ZM, drop=True):
         assert len(self.page_images) == len(self.boxes)
         self.boxes, self.page_layout = self.layouter(
@@ -352,6 +364,7 @@ class RAGFlowPdfParser:
             self.boxes[i]["bottom"] += \
                 self.page_cum_height[self.boxes[i]["page_number"] - 1]
 
+    @profiled("text_merge", lambda self: len(self.boxes))
     def _text_merge(self):
         # merge adjusted boxes
         bxs = self.boxes
@@ -408,6 +421,7 @@ class RAGFlowPdfParser:
             i += 1
         self.boxes = bxs
 
+    @profiled("naive_vertical_merge", lambda self: len(self.boxes))
     def _naive_vertical_merge(self):
         bxs = Recognizer.sort_Y_firstly(
             self.boxes, np.median(
@@ -459,7 +473,11 @@ class RAGFlowPdfParser:
             bxs.pop(i + 1)
         self.boxes = bxs
 
+    @profiled("concat_downward", lambda self: len(self.boxes))
     def _concat_downward(self, concat_between_pages=True):
+        # imported with the model in __init__, not when the module loads
+        import xgboost as xgb
+
         # count boxes in the same row as a feature
         for i in range(len(self.boxes)):
             mh = self.mean_height[self.boxes[i]["page_number"] - 1]
@@ -568,6 +586,7 @@ class RAGFlowPdfParser:
 
         self.boxes = Recognizer.sort_Y_firstly(boxes, 0)
 
+    @profiled("filter_forpages", lambda self: len(self.boxes))
     def _filter_forpages(self):
         if not self.boxes:
             return
@@ -643,6 +662,7 @@ class RAGFlowPdfParser:
             b_["top"] = b["top"]
             self.boxes.pop(i)
 
+    @profiled("extract_table_figure", lambda self: len(self.boxes))
     def _extract_table_figure(self, need_image, ZM,
                               return_html, need_position):
         tables = {}
@@ -974,21 +994,23 @@ class RAGFlowPdfParser:
         self.page_layout = []
         self.page_from = page_from
         start = timer()
-        try:
-            with sys.modules[LOCK_KEY_pdfplumber]:
-                self.pdf = pdfplumber.open(fnm) if isinstance(
-                    fnm, str) else pdfplumber.open(BytesIO(fnm))
-                self.page_images = [p.to_image(resolution=72 * zoomin).annotated for i, p in
-                                    enumerate(self.pdf.pages[page_from:page_to])]
-                try:
-                    self.page_chars = [[c for c in page.dedupe_chars().chars if self._has_color(c)] for page in self.pdf.pages[page_from:page_to]]
-                except Exception as e:
-                    logging.warning(f"Failed to extract characters for pages {page_from}-{page_to}: {str(e)}")
-                    self.page_chars = [[] for _ in range(page_to - page_from)]  # If failed to extract, using empty list instead.
-                    
-                self.total_page = len(self.pdf.pages)
-        except Exception:
-            logging.exception("RAGFlowPdfParser __images__")
+        with profile_stage(self.profiler, "rasterize") as rec:
+            try:
+                with sys.modules[LOCK_KEY_pdfplumber]:
+                    self.pdf = pdfplumber.open(fnm) if isinstance(
+                        fnm, str) else pdfplumber.open(BytesIO(fnm))
+                    self.page_images = [p.to_image(resolution=72 * zoomin).annotated for i, p in
+                                        enumerate(self.pdf.pages[page_from:page_to])]
+                    try:
+                        self.page_chars = [[c for c in page.dedupe_chars().chars if self._has_color(c)] for page in self.pdf.pages[page_from:page_to]]
+                    except Exception as e:
+                        logging.warning(f"Failed to extract characters for pages {page_from}-{page_to}: {str(e)}")
+                        self.page_chars = [[] for _ in range(page_to - page_from)]  # If failed to extract, using empty list instead.
+
+                    self.total_page = len(self.pdf.pages)
+            except Exception:
+                logging.exception("RAGFlowPdfParser __images__")
+            rec["boxes"] = sum([len(cs) for cs in getattr(self, "page_chars", [])])
         logging.info(f"__images__ dedupe_chars cost {timer() - start}s")
 
         self.outlines = []
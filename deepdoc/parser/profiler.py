@@ -0,0 +1,168 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import csv
+import functools
+import json
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from timeit import default_timer as timer
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # Windows has no getrusage, peak_rss is left empty there
+    resource = None
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def _max_rss():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes everywhere else
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class PdfProfiler:
+    """
+    Collects per-stage timings of the PDF pipeline.
+
+    Every record holds the document, page (None for document level stages),
+    stage name, wall time, CPU time, peak memory and the number of boxes the
+    stage produced. `peak_rss` is the high-water mark of the whole process,
+    None where the platform doesn't report it;
+    `peak_traced` is the peak of Python allocations inside the stage and is
+    only filled when `trace_memory` is on, since tracemalloc slows parsing down.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = []
+        self.documents = []
+        self.document = None
+
+    @contextmanager
+    def document_scope(self, name, pages=0):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.document = name
+        doc = {"document": name, "pages": pages, "wall": 0., "error": None}
+        start = timer()
+        try:
+            yield doc
+        except Exception as e:
+            doc["error"] = str(e)
+            raise
+        finally:
+            doc["wall"] = timer() - start
+            self.documents.append(doc)
+            self.document = None
+
+    @contextmanager
+    def stage(self, name, page=None):
+        rec = {"document": self.document, "page": page, "stage": name, "boxes": None}
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        wall, cpu = timer(), time.process_time()
+        try:
+            yield rec
+        finally:
+            rec["wall"] = timer() - wall
+            rec["cpu"] = time.process_time() - cpu
+            rec["peak_rss"] = _max_rss()
+            rec["peak_traced"] = tracemalloc.get_traced_memory()[1] \
+                if self.trace_memory and tracemalloc.is_tracing() else None
+            self.records.append(rec)
+
+    def summary(self):
+        stages = defaultdict(list)
+        for r in self.records:
+            stages[r["stage"]].append(r)
+
+        res = {}
+        for stage, recs in stages.items():
+            wall = np.array([r["wall"] for r in recs])
+            cpu = np.array([r["cpu"] for r in recs])
+            boxes = [r["boxes"] for r in recs if r["boxes"] is not None]
+            rss = [r["peak_rss"] for r in recs if r["peak_rss"] is not None]
+            traced = [r["peak_traced"] for r in recs if r["peak_traced"] is not None]
+            res[stage] = {
+                "count": len(recs),
+                "wall_total": float(np.sum(wall)),
+                "cpu_total": float(np.sum(cpu)),
+                "boxes_total": int(np.sum(boxes)) if boxes else None,
+                "peak_rss": max(rss) if rss else None,
+                "peak_traced": max(traced) if traced else None,
+            }
+            for p in PERCENTILES:
+                res[stage][f"wall_p{p}"] = float(np.percentile(wall, p))
+                res[stage][f"cpu_p{p}"] = float(np.percentile(cpu, p))
+
+        pages = sum(d["pages"] for d in self.documents)
+        wall = sum(d["wall"] for d in self.documents)
+        return {
+            "documents": len(self.documents),
+            "failed": len([d for d in self.documents if d["error"]]),
+            "pages": pages,
+            "wall_total": wall,
+            "pages_per_second": pages / wall if wall else 0.,
+            "stages": res,
+        }
+
+    def dump_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary(),
+                       "documents": self.documents,
+                       "records": self.records}, f, ensure_ascii=False, indent=2)
+
+    def dump_csv(self, path):
+        fields = ["document", "page", "stage", "wall", "cpu", "peak_rss", "peak_traced", "boxes"]
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for r in self.records:
+                writer.writerow({k: r.get(k) for k in fields})
+
+
+def profile_stage(profiler, name, page=None):
+    """Returns `profiler.stage(...)`, or a no-op context when profiling is off."""
+    if profiler is None:
+        return nullcontext({})
+    return profiler.stage(name, page)
+
+
+def profiled(name, boxes=None):
+    """
+    Decorates a document level stage of RAGFlowPdfParser. `boxes` maps the
+    parser to the number of boxes the stage left behind.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with profile_stage(self.profiler, name) as rec:
+                res = func(self, *args, **kwargs)
+                if boxes is not None:
+                    rec["boxes"] = boxes(self)
+            return res
+        return wrapper
+    return decorator
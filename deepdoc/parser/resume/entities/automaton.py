@@ -0,0 +1,81 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+from collections import deque
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton over (word, value) pairs. `findall(txt)` returns
+    the values of every word occurring in `txt` in a single pass over it,
+    instead of one `txt.find(word)` per dictionary word.
+    """
+
+    def __init__(self, words=()):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for w, v in words:
+            self.add(w, v)
+        self.build()
+
+    def add(self, word, value):
+        s = 0
+        for c in word:
+            if c not in self.goto[s]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+                self.goto[s][c] = len(self.goto) - 1
+            s = self.goto[s][c]
+        self.out[s].append(value)
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            s = queue.popleft()
+            for c, t in self.goto[s].items():
+                queue.append(t)
+                f = self.fail[s]
+                while f and c not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[t] = self.goto[f].get(c, 0)
+                if self.fail[t]:
+                    self.out[t] = self.out[t] + self.out[self.fail[t]]
+
+    def findall(self, txt):
+        # the empty word, if any, is found in every text
+        res = list(self.out[0])
+        s = 0
+        for c in txt:
+            while s and c not in self.goto[s]:
+                s = self.fail[s]
+            s = self.goto[s].get(c, 0)
+            if s:
+                res.extend(self.out[s])
+        return res
+
+    def contains_any(self, txt):
+        if self.out[0]:
+            return True
+        s = 0
+        for c in txt:
+            while s and c not in self.goto[s]:
+                s = self.fail[s]
+            s = self.goto[s].get(c, 0)
+            if self.out[s]:
+                return True
+        return False
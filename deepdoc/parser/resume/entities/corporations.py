@@ -21,6 +21,7 @@ import os
 import pandas as pd
 from rag.nlp import rag_tokenizer
 from . import regions
+from .automaton import Automaton
 
 
 current_file_path = os.path.dirname(os.path.abspath(__file__))
@@ -98,31 +99,32 @@ for c, v in CORP_TAG.items():
 CORP_TAG = {corpNorm(rmNoise(c), False): v for c, v in CORP_TAG.items()}
 
 
+# Latin names are matched as a whole, the others anywhere in the name.
+GOOD_CORP_LATIN = set([n for n in GOOD_CORP if re.match(r"[0-9a-zA-Z]+$", n)])
+GOOD_CORP_AC = Automaton([(n, n) for n in GOOD_CORP if n not in GOOD_CORP_LATIN])
+CORP_TAG_KEYS = list(CORP_TAG.keys())
+CORP_TAG_LATIN = {n: i for i, n in enumerate(CORP_TAG_KEYS) if re.match(r"[0-9a-zA-Z., ]+$", n)}
+CORP_TAG_AC = Automaton([(n, i) for i, n in enumerate(CORP_TAG_KEYS) if n not in CORP_TAG_LATIN])
+
+
 def is_good(nm):
-    global GOOD_CORP
     if nm.find("外派") >= 0:
         return False
     nm = rmNoise(nm)
     nm = corpNorm(nm, False)
-    for n in GOOD_CORP:
-        if re.match(r"[0-9a-zA-Z]+$", n):
-            if n == nm:
-                return True
-        elif nm.find(n) >= 0:
-            return True
-    return False
+    return nm in GOOD_CORP_LATIN or GOOD_CORP_AC.contains_any(nm)
 
 
 def corp_tag(nm):
-    global CORP_TAG
     nm = rmNoise(nm)
     nm = corpNorm(nm, False)
-    for n in CORP_TAG.keys():
-        if re.match(r"[0-9a-zA-Z., ]+$", n):
-            if n == nm:
-                return CORP_TAG[n]
-        elif nm.find(n) >= 0:
-            if len(n) < 3 and len(nm) / len(n) >= 2:
-                continue
-            return CORP_TAG[n]
+    # the first key of CORP_TAG which matches wins
+    hits = set(CORP_TAG_AC.findall(nm))
+    if nm in CORP_TAG_LATIN:
+        hits.add(CORP_TAG_LATIN[nm])
+    for i in sorted(hits):
+        n = CORP_TAG_KEYS[i]
+        if n not in CORP_TAG_LATIN and len(n) < 3 and len(nm) / len(n) >= 2:
+            continue
+        return CORP_TAG[n]
     return []
@@ -17,7 +17,6 @@
 import os
 import json
 import re
-import copy
 import pandas as pd
 
 current_file_path = os.path.dirname(os.path.abspath(__file__))
@@ -48,6 +47,12 @@ def loadRank(fnm):
 
 loadRank(os.path.join(current_file_path, "res/school.rank.csv"))
 
+# name or alias -> first row of TBL carrying it
+NAME_IDX = {}
+for i, (cn, en, alias) in enumerate(zip(TBL["name_cn"], TBL["name_en"], TBL["alias"])):
+    for nm in [cn, en] + alias.split("+"):
+        NAME_IDX.setdefault(nm, i)
+
 
 def split(txt):
     tks = []
@@ -75,13 +80,12 @@ def select(nm):
     nm = re.sub(r"[(（][^()（）]+[)）]", "", nm.lower())
     nm = re.sub(r"(^the |[,.&（）();；·]+|^(英国|美国|瑞士))", "", nm)
     nm = re.sub(r"大学.*学院", "大学", nm)
-    tbl = copy.deepcopy(TBL)
-    tbl["hit_alias"] = tbl["alias"].map(lambda x: nm in set(x.split("+")))
-    res = tbl[((tbl.name_cn == nm) | (tbl.name_en == nm) | tbl.hit_alias)]
-    if res.empty:
+    if nm not in NAME_IDX:
         return
 
-    return json.loads(res.to_json(orient="records"))[0]
+    res = json.loads(TBL.iloc[[NAME_IDX[nm]]].to_json(orient="records"))[0]
+    res["hit_alias"] = nm in set(res["alias"].split("+"))
+    return res
 
 
 def is_good(nm):
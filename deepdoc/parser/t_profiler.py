@@ -0,0 +1,83 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import logging
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+from api.utils.file_utils import traversal_files
+from deepdoc.parser import PdfParser
+from deepdoc.parser.profiler import PdfProfiler, PERCENTILES
+import argparse
+
+
+def main(args):
+    if os.path.isdir(args.inputs):
+        files = sorted([f for f in traversal_files(args.inputs) if f.lower().endswith(".pdf")])
+    else:
+        files = [args.inputs]
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    profiler = PdfProfiler(trace_memory=args.trace_memory)
+    parser = PdfParser()
+    parser.profiler = profiler
+    for fnm in files:
+        try:
+            with profiler.document_scope(os.path.relpath(fnm, args.inputs) if os.path.isdir(args.inputs) else fnm) as doc:
+                parser(fnm, need_image=False, zoomin=args.zoomin)
+                doc["pages"] = len(parser.page_images)
+        except Exception:
+            logging.exception(f"Failed to profile {fnm}")
+
+    if args.format in ("json", "both"):
+        profiler.dump_json(os.path.join(args.output_dir, "profile.json"))
+    if args.format in ("csv", "both"):
+        profiler.dump_csv(os.path.join(args.output_dir, "profile.csv"))
+
+    summary = profiler.summary()
+    print(f"{summary['documents']} documents ({summary['failed']} failed), {summary['pages']} pages, "
+          f"{summary['wall_total']:.2f}s, {summary['pages_per_second']:.3f} pages/s")
+    header = ["stage", "count", "wall_total", "cpu_total"] + [f"wall_p{p}" for p in PERCENTILES] + ["boxes_total"]
+    print("\t".join(header))
+    for stage, st in sorted(summary["stages"].items(), key=lambda x: -x[1]["wall_total"]):
+        print("\t".join([stage, str(st["count"])] +
+                        [f"{st[k]:.3f}" for k in header[2:-1]] +
+                        [str(st["boxes_total"])]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--inputs',
+                        help="Directory where to store PDFs, or a file path to a single PDF",
+                        required=True)
+    parser.add_argument('--output_dir', help="Directory where to store the report. Default: './profile_outputs'",
+                        default="./profile_outputs")
+    parser.add_argument('--format', help="Report format. Default: both", choices=["json", "csv", "both"],
+                        default="both")
+    parser.add_argument('--zoomin', help="Zoom factor used to rasterize pages. Default: 3", type=int, default=3)
+    parser.add_argument('--trace_memory', help="Trace peak Python allocations per stage (slow)",
+                        action="store_true")
+    args = parser.parse_args()
+    main(args)
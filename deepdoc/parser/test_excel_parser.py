@@ -0,0 +1,75 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import re
+import zipfile
+from io import BytesIO
+
+import pytest
+from openpyxl import Workbook
+
+from deepdoc.parser.excel_parser import RAGFlowExcelParser
+
+
+def _workbook(dimension=None, rows=100):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Sheet1"
+    ws.append(["name", "score", "note"])
+    for i in range(rows):
+        ws.append([f"n{i}", i, f"c{i}"])
+    buf = BytesIO()
+    wb.save(buf)
+    if dimension is None:
+        return buf.getvalue()
+
+    # writers other than Excel often leave a stale <dimension> record behind
+    out = BytesIO()
+    with zipfile.ZipFile(BytesIO(buf.getvalue())) as src, zipfile.ZipFile(out, "w") as dst:
+        for item in src.infolist():
+            data = src.read(item.filename)
+            if item.filename == "xl/worksheets/sheet1.xml":
+                data = re.sub(rb'<dimension ref="[^"]*"\s*/>', f'<dimension ref="{dimension}"/>'.encode(), data)
+            dst.writestr(item, data)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("dimension", [None, "A1", "A1:B10"])
+def test_stale_dimension(dimension):
+    binary = _workbook(dimension)
+    parser = RAGFlowExcelParser()
+
+    lines = parser(binary)
+    assert len(lines) == 100
+    assert lines[-1] == "name：n99; score：99; note：c99"
+
+    assert RAGFlowExcelParser.row_number("t.xlsx", binary) == 101
+
+    sheets = [(name, list(rows)) for name, rows in RAGFlowExcelParser.iter_sheets(binary)]
+    assert len(sheets) == 1
+    assert all(len(r) == 3 for r in sheets[0][1])
+
+    tables = parser.html(binary, chunk_rows=32)
+    assert len(tables) == 4
+    assert "c99" in tables[-1]
+
+
+def test_empty_sheet():
+    wb = Workbook()
+    buf = BytesIO()
+    wb.save(buf)
+    assert RAGFlowExcelParser()(buf.getvalue()) == []
+    assert RAGFlowExcelParser.row_number("t.xlsx", buf.getvalue()) == 0
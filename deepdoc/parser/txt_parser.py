@@ -16,32 +16,20 @@
 
 import re
 
-from deepdoc.parser.utils import get_text
+from deepdoc.parser.utils import get_text, iter_text
 from rag.nlp import num_tokens_from_string
 
+# characters of text without delimiters after which iter_sections cuts a section anyway
+MAX_SECTION_SIZE = 1 << 16
+
 
 class RAGFlowTxtParser:
     def __call__(self, fnm, binary=None, chunk_token_num=128, delimiter="\n!?;。；！？"):
         txt = get_text(fnm, binary)
         return self.parser_txt(txt, chunk_token_num, delimiter)
 
-    @classmethod
-    def parser_txt(cls, txt, chunk_token_num=128, delimiter="\n!?;。；！？"):
-        if not isinstance(txt, str):
-            raise TypeError("txt type should be str!")
-        cks = [""]
-        tk_nums = [0]
-
-        def add_chunk(t):
-            nonlocal cks, tk_nums, delimiter
-            tnum = num_tokens_from_string(t)
-            if tk_nums[-1] > chunk_token_num:
-                cks.append(t)
-                tk_nums.append(tnum)
-            else:
-                cks[-1] += t
-                tk_nums[-1] += tnum
-
+    @staticmethod
+    def _delimiter_pattern(delimiter):
         dels = []
         s = 0
         for m in re.finditer(r"`([^`]+)`", delimiter, re.I):
@@ -53,11 +41,75 @@ class RAGFlowTxtParser:
             dels.extend(list(delimiter[s:]))
         dels = [re.escape(d) for d in dels if d]
         dels = [d for d in dels if d]
-        dels = "|".join(dels)
-        secs = re.split(r"(%s)" % dels, txt)
-        for sec in secs:
-            if re.match(f"^{dels}$", sec):
+        return "|".join(dels)
+
+    @staticmethod
+    def _merge(secs, chunk_token_num):
+        """Merges sections into chunks, yielding every chunk as soon as it is complete."""
+        ck, tk_num = "", 0
+        for t in secs:
+            tnum = num_tokens_from_string(t)
+            if tk_num > chunk_token_num:
+                yield [ck, ""]
+                ck, tk_num = t, tnum
+            else:
+                ck += t
+                tk_num += tnum
+        yield [ck, ""]
+
+    @classmethod
+    def parser_txt(cls, txt, chunk_token_num=128, delimiter="\n!?;。；！？"):
+        if not isinstance(txt, str):
+            raise TypeError("txt type should be str!")
+        dels = cls._delimiter_pattern(delimiter)
+        secs = [sec for sec in re.split(r"(%s)" % dels, txt) if not re.match(f"^{dels}$", sec)]
+        return list(cls._merge(secs, chunk_token_num))
+
+    @classmethod
+    def iter_sections(cls, fnm, binary=None, delimiter="\n!?;。；！？"):
+        """
+        Splits the text by the delimiters while it is being decoded. The text
+        after the last delimiter found so far is held back, since the next block
+        may extend it or complete a delimiter. Only the newly decoded text is
+        searched for delimiters, and text without any is cut every
+        MAX_SECTION_SIZE characters, so time stays linear and memory bounded.
+        """
+        dels = cls._delimiter_pattern(delimiter)
+        pattern = re.compile(r"(%s)" % dels)
+        # a delimiter split by a block boundary is found by searching this far back
+        overlap = len(delimiter)
+        buf, held, scanned = "", False, 0
+        for txt in iter_text(fnm, binary):
+            buf += txt
+            last = None
+            # the delimiter a held back buffer starts with is no place to cut
+            floor = pattern.match(buf).end() if held else 1
+            for m in pattern.finditer(buf, max(scanned - overlap, floor)):
+                last = m
+            if last is None:
+                if len(buf) <= MAX_SECTION_SIZE:
+                    scanned = len(buf)
+                    continue
+                if held:
+                    buf = buf[floor:]
+                # keep a tail which may be the start of a delimiter
+                while len(buf) > MAX_SECTION_SIZE:
+                    cut = len(buf) - overlap if len(buf) - overlap <= MAX_SECTION_SIZE else MAX_SECTION_SIZE
+                    yield buf[:cut]
+                    buf = buf[cut:]
+                held, scanned = False, len(buf)
                 continue
-            add_chunk(sec)
+            # a held back buffer starts with a delimiter, so its first split is an empty string
+            for sec in pattern.split(buf[:last.start()])[1 if held else 0:]:
+                if not re.match(f"^{dels}$", sec):
+                    yield sec
+            buf, held = buf[last.start():], True
+            scanned = len(buf)
+        for sec in pattern.split(buf)[1 if held else 0:]:
+            if not re.match(f"^{dels}$", sec):
+                yield sec
 
-        return [[c, ""] for c in cks]
+    @classmethod
+    def iter_chunks(cls, fnm, binary=None, chunk_token_num=128, delimiter="\n!?;。；！？"):
+        """Streaming counterpart of __call__ for large files: memory stays flat and chunks come out as produced."""
+        yield from cls._merge(cls.iter_sections(fnm, binary, delimiter), chunk_token_num)
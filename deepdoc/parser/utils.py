@@ -14,19 +14,33 @@
 #  limitations under the License.
 #
 
+import codecs
+
 from rag.nlp import find_codec
 
+TEXT_BLOCK_SIZE = 1 << 20
 
-def get_text(fnm: str, binary=None) -> str:
-    txt = ""
+
+def iter_text(fnm: str, binary=None, block_size=TEXT_BLOCK_SIZE):
+    """Decodes the file, or its binary, block by block instead of all at once."""
     if binary:
-        encoding = find_codec(binary)
-        txt = binary.decode(encoding, errors="ignore")
+        decoder = codecs.getincrementaldecoder(find_codec(binary))(errors="ignore")
+        view = memoryview(binary)
+        for i in range(0, len(view), block_size):
+            txt = decoder.decode(view[i: i + block_size])
+            if txt:
+                yield txt
+        txt = decoder.decode(b"", final=True)
+        if txt:
+            yield txt
     else:
         with open(fnm, "r") as f:
             while True:
-                line = f.readline()
-                if not line:
+                txt = f.read(block_size)
+                if not txt:
                     break
-                txt += line
-    return txt
+                yield txt
+
+
+def get_text(fnm: str, binary=None) -> str:
+    return "".join(iter_text(fnm, binary))
@@ -27,7 +27,6 @@ from . import operators
 import math
 import numpy as np
 import cv2
-import onnxruntime as ort
 
 from .postprocess import build_post_process
 
@@ -67,6 +66,9 @@ def create_operators(op_param_list, global_config=None):
 
 
 def load_model(model_dir, nm):
+    # imported here so that importing the parsers does not load onnxruntime
+    import onnxruntime as ort
+
     model_file_path = os.path.join(model_dir, nm + ".onnx")
     global loaded_models
     loaded_model = loaded_models.get(model_file_path)
@@ -14,13 +14,92 @@
 #  limitations under the License.
 #
 
+import copy
+import io
+import logging
+import os
 import re
+import wave
+
+import numpy as np
 
 from api.db import LLMType
 from rag.nlp import rag_tokenizer
 from api.db.services.llm_service import LLMBundle
 from rag.nlp import tokenize
 
+SEGMENT_SECONDS = int(os.environ.get("SEQ2TXT_SEGMENT_SECONDS", "60"))
+
+
+def _open_wav(binary):
+    try:
+        return wave.open(io.BytesIO(binary))
+    except (wave.Error, EOFError):
+        pass
+    try:
+        from pydub import AudioSegment
+        seg = AudioSegment.from_file(io.BytesIO(binary)).set_channels(1).set_frame_rate(16000)
+        buf = io.BytesIO()
+        seg.export(buf, format="wav")
+        buf.seek(0)
+        return wave.open(buf)
+    except Exception as e:
+        logging.warning("Can't decode the audio to split it: {}".format(e))
+
+
+def _quietest(frames, params, lo, hi):
+    """Returns the start frame of the quietest 20ms window in frames[lo: hi]."""
+    dtype = {1: np.uint8, 2: np.int16, 4: np.int32}.get(params.sampwidth)
+    win = max(params.framerate // 50, 1)
+    n = (hi - lo) // win
+    if dtype is None or n == 0:
+        return hi
+    fb = params.nchannels * params.sampwidth
+    x = np.frombuffer(frames[lo * fb: (lo + n * win) * fb], dtype=dtype).astype(np.float32)
+    if params.sampwidth == 1:
+        x -= 128
+    energy = np.abs(x).reshape(n, win * params.nchannels).mean(axis=1)
+    return lo + int(np.argmin(energy)) * win
+
+
+def split_audio(binary, max_seconds=SEGMENT_SECONDS):
+    """
+    Cuts the audio into segments of at most `max_seconds`, each one ending at
+    the quietest 20ms of its last quarter so that words are rarely cut.
+    Returns [(start_second, end_second, wav_binary)]. Audio which is short or
+    can't be decoded comes back whole, with None as its end.
+    """
+    wav = _open_wav(binary)
+    if wav is None:
+        return [(0, None, binary)]
+    with wav:
+        params = wav.getparams()
+        frames = wav.readframes(params.nframes)
+    step = max_seconds * params.framerate
+    nframes = len(frames) // (params.nchannels * params.sampwidth)
+    if nframes <= step:
+        return [(0, None, binary)]
+
+    segments = []
+    start = 0
+    while start < nframes:
+        end = nframes
+        if start + step < nframes:
+            end = _quietest(frames, params, start + step * 3 // 4, start + step)
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as w:
+            w.setparams(params)
+            fb = params.nchannels * params.sampwidth
+            w.writeframes(frames[start * fb: end * fb])
+        segments.append((start / params.framerate, end / params.framerate, buf.getvalue()))
+        start = end
+    return segments
+
+
+def _timestamp(seconds):
+    seconds = int(seconds)
+    return "%02d:%02d:%02d" % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+
 
 def chunk(filename, binary, tenant_id, lang, callback=None, **kwargs):
     doc = {
@@ -34,10 +113,34 @@ def chunk(filename, binary, tenant_id, lang, callback=None, **kwargs):
     try:
         callback(0.1, "USE Sequence2Txt LLM to transcription the audio")
         seq2txt_mdl = LLMBundle(tenant_id, LLMType.SPEECH2TEXT, lang=lang)
-        ans = seq2txt_mdl.transcription(binary)
-        callback(0.8, "Sequence2Txt LLM respond: %s ..." % ans[:32])
-        tokenize(doc, ans, eng)
-        return [doc]
+        segments = split_audio(binary)
+        if len(segments) == 1:
+            ans = seq2txt_mdl.transcription(binary)
+            if ans.startswith("**ERROR**"):
+                raise Exception(ans)
+            callback(0.8, "Sequence2Txt LLM respond: %s ..." % ans[:32])
+            tokenize(doc, ans, eng)
+            return [doc]
+
+        callback(0.2, "Split the audio into %d segments." % len(segments))
+        anss = seq2txt_mdl.transcription_batch([s for _, _, s in segments], callback=callback)
+        # models answer "**ERROR**: ..." rather than raising, that is no transcript
+        failed = [ans for ans in anss if ans.startswith("**ERROR**")]
+        if len(failed) == len(anss):
+            raise Exception(failed[0])
+        if failed:
+            callback(msg="Sequence2Txt LLM failed on %d of %d segments: %s" % (len(failed), len(anss), failed[0]))
+        segments = [(seg, ans) for seg, ans in zip(segments, anss) if not ans.startswith("**ERROR**")]
+        callback(0.8, "Sequence2Txt LLM respond: %s ..." % "".join([ans for _, ans in segments])[:32])
+        res = []
+        for (start, end, _), ans in segments:
+            if not ans.strip():
+                continue
+            d = copy.deepcopy(doc)
+            tokenize(d, "[%s - %s] %s" % (_timestamp(start), _timestamp(end), ans), eng)
+            d["top_int"] = [int(start)]
+            res.append(d)
+        return res
     except Exception as e:
         callback(prog=-1, msg=str(e))
 
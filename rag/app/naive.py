@@ -17,7 +17,6 @@
 import logging
 from tika import parser
 from io import BytesIO
-from docx import Document
 from timeit import default_timer as timer
 import re
 from deepdoc.parser.pdf_parser import PlainParser
@@ -28,35 +27,20 @@ from rag.utils import num_tokens_from_string
 from PIL import Image
 from functools import reduce
 from markdown import markdown
-from docx.image.exceptions import UnrecognizedImageError, UnexpectedEndOfFileError, InvalidImageStreamError
 
 
 class Docx(DocxParser):
     def __init__(self):
         pass
 
-    def get_picture(self, document, paragraph):
-        img = paragraph._element.xpath('.//pic:pic')
-        if not img:
+    def get_picture(self, images):
+        if not images:
             return None
-        img = img[0]
-        embed = img.xpath('.//a:blip/@r:embed')[0]
-        related_part = document.part.related_parts[embed]
         try:
-            image_blob = related_part.image.blob
-        except UnrecognizedImageError:
-            logging.info("Unrecognized image format. Skipping image.")
-            return None
-        except UnexpectedEndOfFileError:
-            logging.info("EOF was unexpectedly encountered while reading an image stream. Skipping image.")
-            return None
-        except InvalidImageStreamError:
-            logging.info("The recognized image stream appears to be corrupted. Skipping image.")
-            return None
-        try:
-            image = Image.open(BytesIO(image_blob)).convert('RGB')
+            image = Image.open(BytesIO(images[0])).convert('RGB')
             return image
         except Exception:
+            logging.info("Unrecognized or corrupted image. Skipping image.")
             return None
 
     def __clean(self, line):
@@ -64,33 +48,35 @@ class Docx(DocxParser):
         return line
 
     def __call__(self, filename, binary=None, from_page=0, to_page=100000):
-        self.doc = Document(
-            filename) if not binary else Document(BytesIO(binary))
         pn = 0
         lines = []
         last_image = None
-        for p in self.doc.paragraphs:
+        tbls = []
+        for kind, p, style, images in self.iter_body(binary if binary else filename, with_images=True):
+            if kind == "table":
+                tbls.append(((None, self.__html(p)), ""))
+                continue
             if pn > to_page:
-                break
+                continue
             if from_page <= pn < to_page:
                 if p.text.strip():
-                    if p.style and p.style.name == 'Caption':
+                    if style == 'Caption':
                         former_image = None
                         if lines and lines[-1][1] and lines[-1][2] != 'Caption':
                             former_image = lines[-1][1].pop()
                         elif last_image:
                             former_image = last_image
                             last_image = None
-                        lines.append((self.__clean(p.text), [former_image], p.style.name))
+                        lines.append((self.__clean(p.text), [former_image], style))
                     else:
-                        current_image = self.get_picture(self.doc, p)
+                        current_image = self.get_picture(images)
                         image_list = [current_image]
                         if last_image:
                             image_list.insert(0, last_image)
                             last_image = None
-                        lines.append((self.__clean(p.text), image_list, p.style.name if p.style else ""))
+                        lines.append((self.__clean(p.text), image_list, style or ""))
                 else:
-                    if current_image := self.get_picture(self.doc, p):
+                    if current_image := self.get_picture(images):
                         if lines:
                             lines[-1][1].append(current_image)
                         else:
@@ -102,29 +88,29 @@ class Docx(DocxParser):
                 if 'w:br' in run._element.xml and 'type="page"' in run._element.xml:
                     pn += 1
         new_line = [(line[0], reduce(concat_img, line[1]) if line[1] else None) for line in lines]
-
-        tbls = []
-        for tb in self.doc.tables:
-            html = "<table>"
-            for r in tb.rows:
-                html += "<tr>"
-                i = 0
-                while i < len(r.cells):
-                    span = 1
-                    c = r.cells[i]
-                    for j in range(i + 1, len(r.cells)):
-                        if c.text == r.cells[j].text:
-                            span += 1
-                            i = j
-                        else:
-                            break
-                    i += 1
-                    html += f"<td>{c.text}</td>" if span == 1 else f"<td colspan='{span}'>{c.text}</td>"
-                html += "</tr>"
-            html += "</table>"
-            tbls.append(((None, html), ""))
         return new_line, tbls
 
+    @staticmethod
+    def __html(tb):
+        html = "<table>"
+        for r in tb.rows:
+            html += "<tr>"
+            i = 0
+            while i < len(r.cells):
+                span = 1
+                c = r.cells[i]
+                for j in range(i + 1, len(r.cells)):
+                    if c.text == r.cells[j].text:
+                        span += 1
+                        i = j
+                    else:
+                        break
+                i += 1
+                html += f"<td>{c.text}</td>" if span == 1 else f"<td colspan='{span}'>{c.text}</td>"
+            html += "</tr>"
+        html += "</table>"
+        return html
+
 
 class Pdf(PdfParser):
     def __call__(self, filename, binary=None, from_page=0,
@@ -212,6 +198,8 @@ def chunk(filename, binary=None, from_page=0, to_page=100000,
     doc["title_sm_tks"] = rag_tokenizer.fine_grained_tokenize(doc["title_tks"])
     res = []
     pdf_parser = None
+    # the streaming parsers only run while naive_merge reads their sections
+    streamed = False
     if re.search(r"\.docx$", filename, re.IGNORECASE):
         callback(0.1, "Start to parse.")
         sections, tables = Docx()(filename, binary)
@@ -244,16 +232,16 @@ def chunk(filename, binary=None, from_page=0, to_page=100000,
         callback(0.1, "Start to parse.")
         excel_parser = ExcelParser()
         if parser_config.get("html4excel"):
-            sections = [(_, "") for _ in excel_parser.html(binary, 12) if _]
+            sections = [(_, "") for _ in excel_parser.html_iter(binary, 12) if _]
         else:
-            sections = [(_, "") for _ in excel_parser(binary) if _]
+            sections = [(_, "") for _ in excel_parser.iter_lines(binary) if _]
 
     elif re.search(r"\.(txt|py|js|java|c|cpp|h|php|go|ts|sh|cs|kt|sql)$", filename, re.IGNORECASE):
         callback(0.1, "Start to parse.")
-        sections = TxtParser()(filename, binary,
-                               parser_config.get("chunk_token_num", 128),
-                               parser_config.get("delimiter", "\n!?;。；！？"))
-        callback(0.8, "Finish parsing.")
+        sections = TxtParser.iter_chunks(filename, binary,
+                                         parser_config.get("chunk_token_num", 128),
+                                         parser_config.get("delimiter", "\n!?;。；！？"))
+        streamed = True
 
     elif re.search(r"\.(md|markdown)$", filename, re.IGNORECASE):
         callback(0.1, "Start to parse.")
@@ -270,9 +258,9 @@ def chunk(filename, binary=None, from_page=0, to_page=100000,
     elif re.search(r"\.json$", filename, re.IGNORECASE):
         callback(0.1, "Start to parse.")
         chunk_token_num = int(parser_config.get("chunk_token_num", 128))
-        sections = JsonParser(chunk_token_num)(binary)
-        sections = [(_, "") for _ in sections if _]
-        callback(0.8, "Finish parsing.")
+        sections = JsonParser(chunk_token_num).iter_sections(binary)
+        sections = ((_, "") for _ in sections if _)
+        streamed = True
 
     elif re.search(r"\.doc$", filename, re.IGNORECASE):
         callback(0.1, "Start to parse.")
@@ -296,6 +284,8 @@ def chunk(filename, binary=None, from_page=0, to_page=100000,
         sections, int(parser_config.get(
             "chunk_token_num", 128)), parser_config.get(
             "delimiter", "\n!?。；！？"))
+    if streamed:
+        callback(0.8, "Finish parsing.")
     if kwargs.get("section_only", False):
         return chunks
 
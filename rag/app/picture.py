@@ -14,6 +14,7 @@
 #  limitations under the License.
 #
 
+import functools
 import io
 
 import numpy as np
@@ -24,7 +25,11 @@ from api.db.services.llm_service import LLMBundle
 from rag.nlp import tokenize
 from deepdoc.vision import OCR
 
-ocr = OCR()
+
+@functools.lru_cache(maxsize=1)
+def ocr():
+    # loaded on the first picture rather than when the chunkers are imported
+    return OCR()
 
 
 def chunk(filename, binary, tenant_id, lang, callback=None, **kwargs):
@@ -33,7 +38,7 @@ def chunk(filename, binary, tenant_id, lang, callback=None, **kwargs):
         "docnm_kwd": filename,
         "image": img
     }
-    bxs = ocr(np.array(img))
+    bxs = ocr()(np.array(img))
     txt = "\n".join([t[0] for _, t in bxs if t[0]])
     eng = lang.lower() == "english"
     callback(0.4, "Finish OCR: (%s ...)" % txt[:12])
@@ -45,10 +50,7 @@ def chunk(filename, binary, tenant_id, lang, callback=None, **kwargs):
     try:
         callback(0.4, "Use CV LLM to describe the picture.")
         cv_mdl = LLMBundle(tenant_id, LLMType.IMAGE2TEXT, lang=lang)
-        img_binary = io.BytesIO()
-        img.save(img_binary, format='JPEG')
-        img_binary.seek(0)
-        ans = cv_mdl.describe(img_binary.read())
+        ans = cv_mdl.describe_batch([img])[0]
         callback(0.8, "CV LLM respond: %s ..." % ans[:32])
         txt += "\n" + ans
         tokenize(doc, txt, eng)
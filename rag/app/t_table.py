@@ -0,0 +1,74 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import re
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+import pandas as pd
+
+from deepdoc.parser.utils import get_text
+from rag.app.table import Excel, column_data_type, column_data_type_by_cell
+
+
+def load(fnm, delimiter):
+    if re.search(r"\.xlsx?$", fnm, re.IGNORECASE):
+        return Excel()(fnm, callback=lambda prog=None, msg="": None)
+    lines = get_text(fnm).split("\n")
+    headers = lines[0].split(delimiter)
+    rows = [r for r in [line.split(delimiter) for line in lines[1:]] if len(r) == len(headers)]
+    return [pd.DataFrame(np.array(rows), columns=headers)]
+
+
+def main(args):
+    start = timer()
+    dfs = load(args.inputs, args.delimiter)
+    rows = sum([len(df) for df in dfs])
+    elapsed = timer() - start
+    print(f"parse: {rows} rows, {elapsed:.3f}s, {rows / elapsed:.1f} rows/s")
+
+    decisions = {}
+    for name, infer in [("by cell", column_data_type_by_cell), ("vectorized", column_data_type)]:
+        elapsed = []
+        for _ in range(args.repeat):
+            start = timer()
+            decisions[name] = [infer(df[c])[1] for df in dfs for c in df.columns]
+            elapsed.append(timer() - start)
+        print(f"{name}: {np.median(elapsed):.3f}s, {rows / np.median(elapsed):.1f} rows/s")
+    print("column types:", decisions["vectorized"])
+    if decisions["by cell"] != decisions["vectorized"]:
+        print("column types differ from by cell inference:", decisions["by cell"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--inputs', help="A file path to an Excel, csv or txt table", required=True)
+    parser.add_argument('--delimiter', help="Column delimiter of csv and txt files. Default: TAB", default="\t")
+    parser.add_argument('--repeat', help="Times to run the column type inference. Default: 3", type=int, default=3)
+    args = parser.parse_args()
+    main(args)
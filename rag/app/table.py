@@ -16,7 +16,6 @@
 
 import copy
 import re
-from io import BytesIO
 from xpinyin import Pinyin
 import numpy as np
 import pandas as pd
@@ -32,39 +31,24 @@ from deepdoc.parser import ExcelParser
 class Excel(ExcelParser):
     def __call__(self, fnm, binary=None, from_page=0,
                  to_page=10000000000, callback=None):
-        if not binary:
-            wb = Excel._load_excel_to_workbook(fnm)
-        else:
-            wb = Excel._load_excel_to_workbook(BytesIO(binary))
-        total = 0
-        for sheetname in wb.sheetnames:
-            total += len(list(wb[sheetname].rows))
-
         res, fails, done = [], [], 0
         rn = 0
-        for sheetname in wb.sheetnames:
-            ws = wb[sheetname]
-            rows = list(ws.rows)
-            if not rows:
+        for sheetname, rows in self.iter_sheets(binary if binary else fnm):
+            headers = next(rows, None)
+            if headers is None:
                 continue
-            headers = [cell.value for cell in rows[0]]
             missed = set([i for i, h in enumerate(headers) if h is None])
-            headers = [
-                cell.value for i,
-                cell in enumerate(
-                    rows[0]) if i not in missed]
+            headers = [h for i, h in enumerate(headers) if i not in missed]
             if not headers:
                 continue
             data = []
-            for i, r in enumerate(rows[1:]):
+            for i, r in enumerate(rows):
                 rn += 1
                 if rn - 1 < from_page:
                     continue
                 if rn - 1 >= to_page:
                     break
-                row = [
-                    cell.value for ii,
-                    cell in enumerate(r) if ii not in missed]
+                row = [v for ii, v in enumerate(r) if ii not in missed]
                 if len(row) != len(headers):
                     fails.append(str(i))
                     continue
@@ -94,7 +78,15 @@ def trans_bool(s):
         return "no"
 
 
-def column_data_type(arr):
+INT_PATTERN = r"[+-]?[0-9]{,19}(\.0+)?$"
+FLOAT_PATTERN = r"[+-]?[0-9.]{,19}$"
+BOOL_PATTERN = r"(true|yes|是|\*|✓|✔|☑|✅|√|false|no|否|⍻|×)$"
+# Parsing datetimes is the costly part of the inference, so the distinct values
+# left over by the regular expressions are sampled beyond this size.
+DATETIME_SAMPLE_SIZE = 2048
+
+
+def column_data_type_by_cell(arr):
     arr = list(arr)
     counts = {"int": 0, "float": 0, "text": 0, "datetime": 0, "bool": 0}
     trans = {t: f for f, t in
@@ -102,11 +94,11 @@ def column_data_type(arr):
     for a in arr:
         if a is None:
             continue
-        if re.match(r"[+-]?[0-9]{,19}(\.0+)?$", str(a).replace("%%", "")):
+        if re.match(INT_PATTERN, str(a).replace("%%", "")):
             counts["int"] += 1
-        elif re.match(r"[+-]?[0-9.]{,19}$", str(a).replace("%%", "")):
+        elif re.match(FLOAT_PATTERN, str(a).replace("%%", "")):
             counts["float"] += 1
-        elif re.match(r"(true|yes|是|\*|✓|✔|☑|✅|√|false|no|否|⍻|×)$", str(a), flags=re.IGNORECASE):
+        elif re.match(BOOL_PATTERN, str(a), flags=re.IGNORECASE):
             counts["bool"] += 1
         elif trans_datatime(str(a)):
             counts["datetime"] += 1
@@ -127,6 +119,56 @@ def column_data_type(arr):
     return arr, ty
 
 
+def column_data_type(arr, sample_size=DATETIME_SAMPLE_SIZE):
+    """
+    Same decisions as column_data_type_by_cell, but every distinct value is
+    classified and converted only once and the counting is done with numpy.
+    """
+    arr = list(arr)
+    vals = np.empty(len(arr), dtype=object)
+    vals[:] = arr
+    notnull = np.array([a is not None for a in arr], dtype=bool)
+    strs = np.empty(int(notnull.sum()), dtype=object)
+    strs[:] = [str(a) for a in vals[notnull]]
+    codes, uniques = pd.factorize(strs)
+    freq = np.bincount(codes, minlength=len(uniques))
+
+    uni = pd.Series(uniques, dtype=object)
+    stripped = uni.str.replace("%%", "", regex=False)
+    is_int = stripped.str.match(INT_PATTERN).values.astype(bool)
+    is_float = ~is_int & stripped.str.match(FLOAT_PATTERN).values.astype(bool)
+    is_bool = ~is_int & ~is_float & uni.str.match(BOOL_PATTERN, flags=re.IGNORECASE).values.astype(bool)
+    rest = ~(is_int | is_float | is_bool)
+
+    counts = {"int": int(freq[is_int].sum()), "float": int(freq[is_float].sum()), "text": 0, "datetime": 0,
+              "bool": int(freq[is_bool].sum())}
+    n_rest = int(freq[rest].sum())
+    # datetime only wins with more cells than int and float, otherwise skip parsing
+    if n_rest > max(counts["int"], counts["float"]):
+        idx = np.flatnonzero(rest)
+        if sample_size and len(idx) > sample_size:
+            idx = np.random.default_rng(0).choice(idx, sample_size, replace=False)
+        is_dt = np.array([bool(trans_datatime(uniques[i])) for i in idx], dtype=bool)
+        counts["datetime"] = int(round(n_rest * freq[idx][is_dt].sum() / freq[idx].sum()))
+    counts["text"] = n_rest - counts["datetime"]
+    counts = sorted(counts.items(), key=lambda x: x[1] * -1)
+    ty = counts[0][0]
+
+    if ty == "text":
+        vals[notnull] = strs
+        return list(vals), ty
+
+    trans = {"int": int, "float": float, "datetime": trans_datatime, "bool": trans_bool}[ty]
+    converted = np.empty(len(uniques), dtype=object)
+    for i, u in enumerate(uniques):
+        try:
+            converted[i] = trans(u)
+        except Exception:
+            converted[i] = None
+    vals[notnull] = converted[codes]
+    return list(vals), ty
+
+
 def chunk(filename, binary=None, from_page=0, to_page=10000000000,
           lang="Chinese", callback=None, **kwargs):
     """
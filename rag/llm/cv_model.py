@@ -30,6 +30,33 @@ from rag.nlp import is_english
 from api.utils import get_uuid
 from api.utils.file_utils import get_project_base_directory
 
+IMAGE_MAX_SIDE = int(os.environ.get("IMAGE2TEXT_MAX_SIDE", "1536"))
+IMAGE_MAX_BYTES = int(os.environ.get("IMAGE2TEXT_MAX_BYTES", str(1024 * 1024)))
+
+
+def fit_image(image, max_side=IMAGE_MAX_SIDE, max_bytes=IMAGE_MAX_BYTES):
+    """
+    Re-encodes the image (PIL image, bytes or BytesIO) as a JPEG whose longer
+    side is at most `max_side` and whose size is at most `max_bytes`, lowering
+    the quality first and the resolution after. Returns the JPEG bytes.
+    """
+    if isinstance(image, bytes):
+        image = BytesIO(image)
+    if isinstance(image, BytesIO):
+        image = Image.open(image)
+    image = image.convert("RGB")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side))
+    while True:
+        for quality in (90, 75, 60, 45):
+            buffered = BytesIO()
+            image.save(buffered, format="JPEG", quality=quality)
+            if buffered.tell() <= max_bytes:
+                return buffered.getvalue()
+        if min(image.size) < 64:
+            return buffered.getvalue()
+        image = image.resize((image.size[0] * 3 // 4, image.size[1] * 3 // 4))
+
 
 class Base(ABC):
     def __init__(self, key, model_name):
@@ -15,6 +15,7 @@
 #
 import re
 import threading
+import time
 from urllib.parse import urljoin
 
 import requests
@@ -30,12 +31,86 @@ from api.utils.file_utils import get_home_cache_dir
 from rag.utils import num_tokens_from_string, truncate
 import json
 
+# pairs of concurrent similarity calls of the local rerankers are scored together
+RERANK_BATCHING = os.environ.get("RERANK_BATCHING", "0") == "1"
+# seconds a batch waits for more calls before it runs
+RERANK_BATCH_WAIT = float(os.environ.get("RERANK_BATCH_WAIT", "0.005"))
+# pairs the device scores at once when batching, for DefaultRerank and YoudaoRerank
+RERANK_BATCH_SIZE = int(os.environ.get("RERANK_BATCH_SIZE", "64"))
+YOUDAO_RERANK_BATCH_SIZE = int(os.environ.get("YOUDAO_RERANK_BATCH_SIZE", "8"))
 
 
 def sigmoid(x):
     return 1 / (1 + np.exp(-x))
 
 
+class PairBatcher:
+    """
+    Scores the (query, passage) pairs of concurrent callers with one worker
+    thread. The worker takes every pending call, waiting up to `wait` seconds
+    for batch_size pairs to gather, sorts the pairs by length and runs them
+    through `score_fn` in batches of batch_size, so a batch pads to similar
+    lengths. Scores go back to the calls in their order.
+    """
+
+    def __init__(self, score_fn, batch_size=RERANK_BATCH_SIZE, wait=RERANK_BATCH_WAIT):
+        self.score_fn = score_fn
+        self.batch_size = batch_size
+        self.wait = wait
+        self.cond = threading.Condition()
+        self.pending = []
+        self.worker = None
+        self.stats = {"calls": 0, "pairs": 0, "batches": 0, "rounds": 0}
+
+    def score(self, pairs):
+        if not pairs:
+            return np.array([])
+        call = {"pairs": pairs, "done": threading.Event(), "scores": None, "error": None}
+        with self.cond:
+            self.pending.append(call)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self._run, name="rerank_batcher", daemon=True)
+                self.worker.start()
+            self.cond.notify()
+        call["done"].wait()
+        if call["error"] is not None:
+            raise call["error"]
+        return call["scores"]
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.pending:
+                    self.cond.wait()
+                deadline = time.time() + self.wait
+                while sum([len(c["pairs"]) for c in self.pending]) < self.batch_size and time.time() < deadline:
+                    self.cond.wait(deadline - time.time())
+                calls, self.pending = self.pending, []
+
+            pairs = [p for c in calls for p in c["pairs"]]
+            try:
+                order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+                scores = np.zeros(len(pairs))
+                batches = 0
+                for st in range(0, len(order), self.batch_size):
+                    idx = order[st: st + self.batch_size]
+                    scores[idx] = self.score_fn([pairs[i] for i in idx])
+                    batches += 1
+                st = 0
+                for c in calls:
+                    c["scores"] = scores[st: st + len(c["pairs"])]
+                    st += len(c["pairs"])
+                self.stats["calls"] += len(calls)
+                self.stats["pairs"] += len(pairs)
+                self.stats["batches"] += batches
+                self.stats["rounds"] += 1
+            except Exception as e:
+                for c in calls:
+                    c["error"] = e
+            for c in calls:
+                c["done"].set()
+
+
 class Base(ABC):
     def __init__(self, key, model_name):
         pass
@@ -58,6 +133,8 @@ class Base(ABC):
 class DefaultRerank(Base):
     _model = None
     _model_lock = threading.Lock()
+    _batcher = None
+    _batcher_batch_size = RERANK_BATCH_SIZE
 
     def __init__(self, key, model_name, **kwargs):
         """
@@ -89,9 +166,35 @@ class DefaultRerank(Base):
         self._model = DefaultRerank._model
         self._dynamic_batch_size = 8 
         self._min_batch_size = 1
-
-    
-    def torch_empty_cache(self):
+        self.batching = RERANK_BATCHING
+        self._batcher = self._get_batcher()
+
+    @classmethod
+    def _get_batcher(cls):
+        # one worker per model, which is shared by the instances of a class
+        with cls._model_lock:
+            if cls.__dict__.get("_batcher") is None:
+                cls._batcher = PairBatcher(cls._score_batch, cls._batcher_batch_size)
+        return cls._batcher
+
+    @classmethod
+    def _score_batch(cls, pairs):
+        """
+        Scores a batch of the batcher in one call, splitting it in halves while
+        the device runs out of memory. The batcher sizes the batches, so
+        _dynamic_batch_size isn't involved.
+        """
+        try:
+            return sigmoid(np.array(cls._model.compute_score(pairs), dtype=float)).reshape(-1)
+        except RuntimeError as e:
+            if "CUDA out of memory" not in str(e) or len(pairs) < 2:
+                raise
+            cls.torch_empty_cache()
+            half = len(pairs) // 2
+            return np.concatenate([cls._score_batch(pairs[:half]), cls._score_batch(pairs[half:])])
+
+    @staticmethod
+    def torch_empty_cache():
         try:
             import torch
             torch.cuda.empty_cache()
@@ -144,6 +247,8 @@ class DefaultRerank(Base):
         token_count = 0
         for _, t in pairs:
             token_count += num_tokens_from_string(t)
+        if self.batching:
+            return self._batcher.score(pairs), token_count
         batch_size = 4096
         res = self._process_batch(pairs, max_batch_size=batch_size)
         return np.array(res), token_count
@@ -177,6 +282,9 @@ class JinaRerank(Base):
 class YoudaoRerank(DefaultRerank):
     _model = None
     _model_lock = threading.Lock()
+    _batcher = None
+    # it scored 8 pairs at a time before batching
+    _batcher_batch_size = YOUDAO_RERANK_BATCH_SIZE
 
     def __init__(self, key=None, model_name="maidalun1020/bce-reranker-base_v1", **kwargs):
         if not settings.LIGHTEN and not YoudaoRerank._model:
@@ -193,12 +301,18 @@ class YoudaoRerank(DefaultRerank):
                                 "maidalun1020", "InfiniFlow"))
 
         self._model = YoudaoRerank._model
+        self._dynamic_batch_size = 8
+        self._min_batch_size = 1
+        self.batching = RERANK_BATCHING
+        self._batcher = self._get_batcher()
 
     def similarity(self, query: str, texts: list):
         pairs = [(query, truncate(t, self._model.max_length)) for t in texts]
         token_count = 0
         for _, t in pairs:
             token_count += num_tokens_from_string(t)
+        if self.batching:
+            return self._batcher.score(pairs), token_count
         batch_size = 8
         res = self._process_batch(pairs, max_batch_size=batch_size)
         return np.array(res), token_count
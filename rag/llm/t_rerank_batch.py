@@ -0,0 +1,128 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from deepdoc.parser.utils import get_text
+from rag.llm import rerank_model
+
+
+class SimulatedModel:
+    """
+    Stands for a local reranker on one device: a call costs `overhead` plus
+    `per_pair` for each pair, and calls run one at a time.
+    """
+
+    def __init__(self, overhead, per_pair):
+        self.overhead = overhead
+        self.per_pair = per_pair
+        self.lock = threading.Lock()
+
+    def similarity(self, query, texts):
+        return self.score([(query, t) for t in texts]), 0
+
+    def score(self, pairs):
+        with self.lock:
+            time.sleep(self.overhead + self.per_pair * len(pairs))
+        return np.array([len(q) + len(t) for q, t in pairs], dtype=float)
+
+
+def run(similarity, queries, passages, args):
+    """Every chat reranks `args.passages` passages for `args.rounds` queries."""
+    latencies = []
+
+    def chat(i):
+        rnd = random.Random(i)
+        for _ in range(args.rounds):
+            texts = rnd.sample(passages, min(args.passages, len(passages)))
+            start = time.time()
+            similarity(rnd.choice(queries), texts)
+            latencies.append(time.time() - start)
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(chat, range(args.concurrency)))
+    elapsed = time.time() - start
+    return elapsed, np.array(latencies)
+
+
+def main(args):
+    if args.inputs:
+        lines = [line.strip() for line in get_text(args.inputs).split("\n") if line.strip()]
+    else:
+        lines = [" ".join(["passage"] * random.randint(8, 200)) for _ in range(1000)]
+    queries = [line[:64] for line in lines[:100]]
+
+    if args.simulate:
+        model = SimulatedModel(args.overhead, args.per_pair)
+        batcher = rerank_model.PairBatcher(model.score, args.batch_size, args.wait)
+        modes = [("per call", model.similarity), ("batched", lambda q, texts: (batcher.score([(q, t) for t in texts]), 0))]
+    else:
+        # the instances share the model and its batcher
+        per_call = rerank_model.DefaultRerank(None, args.model)
+        per_call.batching = False
+        batched = rerank_model.DefaultRerank(None, args.model)
+        batched.batching = True
+        batcher = batched._batcher
+        batcher.batch_size = args.batch_size
+        batcher.wait = args.wait
+
+        # the warmup loads the model onto the device
+        per_call.similarity(queries[0], lines[:8])
+        modes = [("per call", per_call.similarity), ("batched", batched.similarity)]
+
+    for name, similarity in modes:
+        elapsed, latencies = run(similarity, queries, lines, args)
+        pairs = len(latencies) * min(args.passages, len(lines))
+        print(f"{name}: {pairs / elapsed:.1f} pairs/s, "
+              f"p50 {np.percentile(latencies, 50) * 1000:.0f}ms, p99 {np.percentile(latencies, 99) * 1000:.0f}ms")
+    print("batcher:", batcher.stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--inputs', help="A text file, one passage per line. Default: synthetic passages")
+    parser.add_argument('--model', help="Model of DefaultRerank. Default: BAAI/bge-reranker-v2-m3",
+                        default="BAAI/bge-reranker-v2-m3")
+    parser.add_argument('--simulate', help="Use a simulated model instead of loading one", action="store_true")
+    parser.add_argument('--overhead', help="Seconds a simulated call costs. Default: 0.02", type=float, default=0.02)
+    parser.add_argument('--per_pair', help="Seconds a simulated pair costs. Default: 0.0002", type=float, default=0.0002)
+    parser.add_argument('--concurrency', help="Number of concurrent chats. Default: 50", type=int, default=50)
+    parser.add_argument('--rounds', help="Queries per chat. Default: 4", type=int, default=4)
+    parser.add_argument('--passages', help="Passages per query. Default: 64", type=int, default=64)
+    parser.add_argument('--batch_size', help="Pairs per batch. Default: RERANK_BATCH_SIZE", type=int,
+                        default=rerank_model.RERANK_BATCH_SIZE)
+    parser.add_argument('--wait', help="Seconds a batch waits for more calls. Default: RERANK_BATCH_WAIT", type=float,
+                        default=rerank_model.RERANK_BATCH_WAIT)
+    args = parser.parse_args()
+    main(args)
@@ -14,11 +14,12 @@
 #  limitations under the License.
 #
 
+import itertools
 import logging
 import random
 from collections import Counter
 
-from rag.utils import num_tokens_from_string
+from rag.utils import num_tokens_from_string, num_tokens_from_strings
 from . import rag_tokenizer
 import re
 import copy
@@ -505,16 +506,17 @@ def hierarchical_merge(bull, sections, depth):
 
 
 def naive_merge(sections, chunk_token_num=128, delimiter="\n。；！？"):
-    if not sections:
+    # sections may be a generator from the streaming parsers, which is true even when empty
+    sections = iter(sections)
+    first = next(sections, None)
+    if first is None:
         return []
-    if isinstance(sections[0], type("")):
-        sections = [(s, "") for s in sections]
+    sections = itertools.chain([first], sections)
     cks = [""]
     tk_nums = [0]
 
-    def add_chunk(t, pos):
+    def add_chunk(t, pos, tnum):
         nonlocal cks, tk_nums, delimiter
-        tnum = num_tokens_from_string(t)
         if not pos:
             pos = ""
         if tnum < 8:
@@ -532,8 +534,13 @@ def naive_merge(sections, chunk_token_num=128, delimiter="\n。；！？"):
             cks[-1] += t
             tk_nums[-1] += tnum
 
-    for sec, pos in sections:
-        add_chunk(sec, pos)
+    # count the tokens of a batch of sections at once, without draining a generator
+    while True:
+        batch = [(sec, "") if isinstance(sec, type("")) else sec for sec in itertools.islice(sections, 256)]
+        if not batch:
+            break
+        for (t, pos), tnum in zip(batch, num_tokens_from_strings([t for t, _ in batch])):
+            add_chunk(t, pos, tnum)
 
     return cks
 
@@ -0,0 +1,170 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import functools
+import json
+import logging
+import os
+import string
+import struct
+import sys
+
+import datrie
+import numpy as np
+
+FORMAT_VERSION = 1
+MAGIC = b"RAGTRIE\0"
+# value of the reversed keys, which only serve prefix lookups
+NO_TAG = -1
+LOOKUP_CACHE_SIZE = 1 << 18
+
+
+def _raw(k):
+    # RagTokenizer keys are the repr of the utf-8 bytes, e.g. "\\xe4\\xb8\\xad"
+    return k.encode("latin-1").decode("unicode_escape").encode("latin-1")
+
+
+def _source_stamp(sources):
+    return {os.path.basename(s): [os.stat(s).st_size, os.stat(s).st_mtime_ns] for s in sources if os.path.exists(s)}
+
+
+class MmapTrie:
+    """
+    Read-only dictionary of RagTokenizer in a single file which every process
+    memory-maps, so that the pages are shared instead of each process loading
+    its own datrie. Keys are kept sorted in a fixed width array, and lookups
+    are binary searches over it. It answers `k in trie`, `trie[k]` and
+    `trie.has_keys_with_prefix(k)` as the datrie it was built from does.
+    Keys added afterwards, by user dictionaries, go to an in-memory datrie.
+
+    Layout: MAGIC, header length (uint64), JSON header, then the key, frequency
+    and tag arrays at the offsets given in the header.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a compiled dictionary")
+            n, = struct.unpack("<Q", f.read(8))
+            self.header = json.loads(f.read(n))
+        if self.header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path} has version {self.header.get('version')}, expected {FORMAT_VERSION}")
+        h = self.header
+        self.keys = np.memmap(path, dtype=f"S{h['width']}", mode="r", offset=h["keys"], shape=(h["count"],))
+        self.freqs = np.memmap(path, dtype=np.int16, mode="r", offset=h["freqs"], shape=(h["count"],))
+        self.tag_ids = np.memmap(path, dtype=np.int32, mode="r", offset=h["tags"], shape=(h["count"],))
+        self.tags = h["tag_names"]
+        self.overlay = datrie.Trie(string.printable)
+        self._search = functools.lru_cache(maxsize=LOOKUP_CACHE_SIZE)(self._search)
+
+    @staticmethod
+    def build(items, path, sources=()):
+        """
+        Compiles (key, value) pairs of a RagTokenizer datrie into `path`. The
+        size and mtime of `sources`, the files the datrie comes from, are
+        recorded for `is_fresh`.
+        """
+        items = sorted((_raw(k), v) for k, v in items)
+        tag_names = sorted(set([v[1] for _, v in items if v != 1]))
+        tag_idx = {t: i for i, t in enumerate(tag_names)}
+        width = max([len(k) for k, _ in items] + [1])
+        keys = np.array([k for k, _ in items], dtype=f"S{width}")
+        freqs = np.array([0 if v == 1 else v[0] for _, v in items], dtype=np.int16)
+        tag_ids = np.array([NO_TAG if v == 1 else tag_idx[v[1]] for _, v in items], dtype=np.int32)
+
+        header = {"version": FORMAT_VERSION, "count": len(items), "width": width, "tag_names": tag_names,
+                  "sources": _source_stamp(sources)}
+        # offsets depend on the header length, which depends on the offsets
+        header.update({"keys": 0, "freqs": 0, "tags": 0})
+        base = len(MAGIC) + 8 + len(json.dumps(header)) + 64
+        base += -base % 8
+        header["keys"] = base
+        header["freqs"] = base + keys.nbytes + (-keys.nbytes % 8)
+        header["tags"] = header["freqs"] + freqs.nbytes + (-freqs.nbytes % 8)
+        bheader = json.dumps(header).encode("utf-8").ljust(base - len(MAGIC) - 8)
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(bheader)))
+            f.write(bheader)
+            for offset, arr in [(header["keys"], keys), (header["freqs"], freqs), (header["tags"], tag_ids)]:
+                f.write(b"\0" * (offset - f.tell()))
+                f.write(arr.tobytes())
+        # concurrent builders each write their own file, the last rename wins
+        os.replace(tmp, path)
+        logging.info(f"[HUQIE]:Compiled {len(items)} keys to {path}")
+
+    @staticmethod
+    def is_fresh(path, sources):
+        try:
+            with open(path, "rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    return False
+                n, = struct.unpack("<Q", f.read(8))
+                header = json.loads(f.read(n))
+            return header.get("version") == FORMAT_VERSION and header.get("sources") == _source_stamp(sources)
+        except Exception:
+            return False
+
+    def _search(self, k):
+        """Returns the index of `k`, -1 if absent, and whether some key starts with `k`."""
+        raw = _raw(k)
+        i = int(np.searchsorted(self.keys, raw))
+        if i >= len(self.keys):
+            return -1, False
+        key = self.keys[i]
+        return (i if key == raw else -1), key.startswith(raw)
+
+    def __contains__(self, k):
+        return k in self.overlay or self._search(k)[0] >= 0
+
+    def __getitem__(self, k):
+        if k in self.overlay:
+            return self.overlay[k]
+        i = self._search(k)[0]
+        if i < 0:
+            raise KeyError(k)
+        if self.tag_ids[i] == NO_TAG:
+            return 1
+        return int(self.freqs[i]), self.tags[self.tag_ids[i]]
+
+    def __setitem__(self, k, v):
+        self.overlay[k] = v
+
+    def has_keys_with_prefix(self, k):
+        return self.overlay.has_keys_with_prefix(k) or self._search(k)[1]
+
+    def items(self):
+        for i in range(len(self.keys)):
+            k = str(bytes(self.keys[i]))[2:-1]
+            if k not in self.overlay:
+                yield k, self[k]
+        yield from self.overlay.items()
+
+    def save(self, path):
+        trie = datrie.Trie(string.printable)
+        for k, v in self.items():
+            trie[k] = v
+        trie.save(path)
+
+
+if __name__ == "__main__":
+    # python rag/nlp/mmap_trie.py [rag/res/huqie.txt.trie]
+    trie_file_name = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "../res/huqie.txt.trie")
+    base = trie_file_name[:-len(".trie")]
+    MmapTrie.build(datrie.Trie.load(trie_file_name).items(), base + ".mmap", [base, trie_file_name])
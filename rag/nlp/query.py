@@ -14,13 +14,21 @@
 #  limitations under the License.
 #
 
+import copy
+import functools
+import itertools
 import logging
 import json
+import os
 import re
+import numpy as np
+from scipy import sparse
 from rag.utils.doc_store_conn import MatchTextExpr
 
 from rag.nlp import rag_tokenizer, term_weight, synonym
 
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "4096"))
+
 
 class FulltextQueryer:
     def __init__(self):
@@ -35,6 +43,8 @@ class FulltextQueryer:
             "content_ltks^2",
             "content_sm_ltks",
         ]
+        self._question = functools.lru_cache(maxsize=QUERY_CACHE_SIZE)(self._question)
+        self._dict_versions = (self.syn.version, self.tw.version)
 
     @staticmethod
     def subSpecialChar(line):
@@ -78,7 +88,24 @@ class FulltextQueryer:
         ).strip()
         txt = FulltextQueryer.rmWWW(txt)
 
-        if not self.isChinese(txt):
+        # cached queries do not look synonyms up, let them count towards the reload
+        self.syn.refresh()
+        versions = (self.syn.version, self.tw.version)
+        if versions != self._dict_versions:
+            self._question.cache_clear()
+            self._dict_versions = versions
+        matchText, keywords = self._question(txt, tbl, min_match, self.isChinese(txt))
+        # callers adjust the options of the expression and extend the keywords
+        return copy.deepcopy(matchText), list(keywords)
+
+    def cache_info(self):
+        info = self._question.cache_info()
+        total = info.hits + info.misses
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize,
+                "hit_rate": info.hits / total if total else 0.0}
+
+    def _question(self, txt, tbl, min_match, is_chinese):
+        if not is_chinese:
             txt = FulltextQueryer.rmWWW(txt)
             tks = rag_tokenizer.tokenize(txt).split()
             keywords = [t for t in tks if t]
@@ -202,30 +229,84 @@ class FulltextQueryer:
 
     def hybrid_similarity(self, avec, bvecs, atks, btkss, tkweight=0.3, vtweight=0.7):
         from sklearn.metrics.pairwise import cosine_similarity as CosineSimilarity
-        import numpy as np
 
         sims = CosineSimilarity([avec], bvecs)
-        tksim = self.token_similarity(atks, btkss)
-        if np.sum(sims[0]) == 0:
-            return np.array(tksim), tksim, sims[0]
-        return np.array(sims[0]) * vtweight + np.array(tksim) * tkweight, tksim, sims[0]
+        return self.hybrid_similarity_of(sims[0], atks, btkss, tkweight, vtweight)
+
+    def hybrid_similarity_of(self, vtsim, atks, btkss, tkweight=0.3, vtweight=0.7):
+        """hybrid_similarity with the vector similarities given, e.g. as computed by the doc store."""
+        tksim = self._token_similarity(atks, btkss)
+        if np.sum(vtsim) == 0:
+            return tksim, tksim.tolist(), vtsim
+        return np.array(vtsim) * vtweight + tksim * tkweight, tksim.tolist(), vtsim
 
     def token_similarity(self, atks, btkss):
-        def toDict(tks):
-            d = {}
-            if isinstance(tks, str):
-                tks = tks.split()
-            for t, c in self.tw.weights(tks, preprocess=False):
-                if t not in d:
-                    d[t] = 0
-                d[t] += c
-            return d
-
-        atks = toDict(atks)
-        btkss = [toDict(tks) for tks in btkss]
-        return [self.similarity(atks, btks) for btks in btkss]
+        return self._token_similarity(atks, btkss).tolist()
+
+    def _token_similarity(self, atks, btkss):
+        """
+        similarity() of the query against every document at once. Documents are
+        rows of a sparse 0/1 matrix over the query tokens, so the scores are a
+        single product with the query weights. Column 0 holds the 1e-9 that
+        similarity() starts its sum from, which keeps the scores bit-identical.
+        """
+        if isinstance(atks, str):
+            atks = atks.split()
+        qtwt = {}
+        for t, c in self.tw.weights(atks, preprocess=False):
+            qtwt[t] = qtwt.get(t, 0) + c
+        vocab = {t: i + 1 for i, t in enumerate(qtwt)}
+        qw = np.array([1e-9] + list(qtwt.values()), dtype=np.float64)
+        m = self._doc_token_matrix(btkss, vocab)
+        q = 1e-9
+        for v in qtwt.values():
+            q += v
+        return m.dot(qw) / q
+
+    def token_similarity_matrix(self, atkss, btkss):
+        """
+        _token_similarity of every query against every document, as a
+        (queries, documents) array. The document matrix is built once over the
+        tokens of all the queries.
+        """
+        qtwts, vocab = [], {}
+        atkss = [atks.split() if isinstance(atks, str) else atks for atks in atkss]
+        for tw in self.tw.weights_batch(atkss):
+            qtwt = {}
+            for t, c in tw:
+                qtwt[t] = qtwt.get(t, 0) + c
+                vocab.setdefault(t, len(vocab) + 1)
+            qtwts.append(qtwt)
+        qw = np.zeros((len(vocab) + 1, len(qtwts)), dtype=np.float64)
+        qw[0, :] = 1e-9
+        q = np.full(len(qtwts), 1e-9)
+        for j, qtwt in enumerate(qtwts):
+            for t, v in qtwt.items():
+                qw[vocab[t], j] = v
+                q[j] += v
+        m = self._doc_token_matrix(btkss, vocab)
+        return (m.dot(qw) / q).T
+
+    @staticmethod
+    def _doc_token_matrix(btkss, vocab):
+        """Rows of 0/1 for the tokens of `vocab`, numbered from 1, each document has. Column 0 is all 1."""
+        btkss = [tks.split() if isinstance(tks, str) else tks for tks in btkss]
+        lens = np.fromiter(map(len, btkss), dtype=np.int64, count=len(btkss))
+        cols = np.fromiter(map(vocab.get, itertools.chain.from_iterable(btkss), itertools.repeat(0)),
+                           dtype=np.int64, count=int(lens.sum()))
+        rows = np.repeat(np.arange(len(btkss)), lens)
+        rows, cols = rows[cols > 0], cols[cols > 0]
+        rows = np.concatenate([np.arange(len(btkss)), rows])
+        cols = np.concatenate([np.zeros(len(btkss), dtype=np.int64), cols])
+        m = sparse.csr_matrix((np.ones(len(cols)), (rows, cols)), shape=(len(btkss), len(vocab) + 1))
+        # a token counts once however often the document repeats it
+        m.data[:] = 1.
+        return m
 
     def similarity(self, qtwt, dtwt):
+        if isinstance(dtwt, type("")) and isinstance(qtwt, type("")):
+            dtwt, qtwt = [{t: w for t, w in tw}
+                          for tw in self.tw.weights_batch([self.tw.split(dtwt), self.tw.split(qtwt)])]
         if isinstance(dtwt, type("")):
             dtwt = {t: w for t, w in self.tw.weights(self.tw.split(dtwt), preprocess=False)}
         if isinstance(qtwt, type("")):
@@ -17,7 +17,9 @@
 import logging
 import copy
 import datrie
+import functools
 import math
+import multiprocessing
 import os
 import re
 import string
@@ -26,6 +28,20 @@ from hanziconv import HanziConv
 from nltk import word_tokenize
 from nltk.stem import PorterStemmer, WordNetLemmatizer
 from api.utils.file_utils import get_project_base_directory
+from rag.nlp.mmap_trie import MmapTrie
+
+TOKENIZER_CACHE_SIZE = int(os.environ.get("TOKENIZER_CACHE_SIZE", "65536"))
+# only strings up to the size of a query or a title repeat often enough to be worth caching
+TOKENIZER_CACHE_MAX_LEN = int(os.environ.get("TOKENIZER_CACHE_MAX_LEN", "128"))
+# tokenize_batch forks its pool only for at least this many distinct strings, below it the fork costs more
+TOKENIZER_POOL_MIN_LINES = int(os.environ.get("TOKENIZER_POOL_MIN_LINES", "2048"))
+# dfs: exhaustive search, dp: beam search, linear in the length but without the pruning
+# of dfs, so it may segment differently, auto: dfs up to TOKENIZER_DFS_MAX_LEN characters, dp beyond.
+TOKENIZER_SEGMENTER = os.environ.get("TOKENIZER_SEGMENTER", "dfs")
+TOKENIZER_DFS_MAX_LEN = int(os.environ.get("TOKENIZER_DFS_MAX_LEN", "16"))
+TOKENIZER_BEAM = int(os.environ.get("TOKENIZER_BEAM", "8"))
+# datrie: a private trie per process, mmap: a compiled file shared by all processes
+TOKENIZER_DICT_FORMAT = os.environ.get("TOKENIZER_DICT_FORMAT", "datrie")
 
 
 class RagTokenizer:
@@ -68,26 +84,45 @@ class RagTokenizer:
 
         self.SPLIT_CHAR = r"([ ,\.<>/?;:'\[\]\\`!@#$%^&*\(\)\{\}\|_+=《》，。？、；‘’：“”【】~！￥%……（）——-]+|[a-zA-Z0-9,\.-]+)"
 
+        self.SEGMENTER = TOKENIZER_SEGMENTER
+        self._tokenize_cached = functools.lru_cache(maxsize=TOKENIZER_CACHE_SIZE)(self._tokenize)
+        self._fine_grained_tokenize_cached = functools.lru_cache(maxsize=TOKENIZER_CACHE_SIZE)(
+            self._fine_grained_tokenize)
+
+        mmap_file_name = self.DIR_ + ".txt.mmap"
         trie_file_name = self.DIR_ + ".txt.trie"
+        if TOKENIZER_DICT_FORMAT == "mmap" and MmapTrie.is_fresh(mmap_file_name, [self.DIR_ + ".txt", trie_file_name]):
+            try:
+                self.trie_ = MmapTrie(mmap_file_name)
+                return
+            except Exception:
+                logging.exception(f"[HUQIE]:Fail to load compiled dictionary {mmap_file_name}, rebuild it")
+
         # check if trie file existence
         if os.path.exists(trie_file_name):
             try:
                 # load trie from file
                 self.trie_ = datrie.Trie.load(trie_file_name)
-                return
             except Exception:
                 # fail to load trie from file, build default trie
                 logging.exception(f"[HUQIE]:Fail to load trie file {trie_file_name}, build the default trie file")
-                self.trie_ = datrie.Trie(string.printable)
+                self.trie_ = None
         else:
             # file not exist, build default trie
             logging.info(f"[HUQIE]:Trie file {trie_file_name} not found, build the default trie file")
+            self.trie_ = None
+
+        if self.trie_ is None:
             self.trie_ = datrie.Trie(string.printable)
+            # load data from dict file and save to trie file
+            self.loadDict_(self.DIR_ + ".txt")
 
-        # load data from dict file and save to trie file
-        self.loadDict_(self.DIR_ + ".txt")
+        if TOKENIZER_DICT_FORMAT == "mmap":
+            MmapTrie.build(self.trie_.items(), mmap_file_name, [self.DIR_ + ".txt", trie_file_name])
+            self.trie_ = MmapTrie(mmap_file_name)
 
     def loadUserDict(self, fnm):
+        self.cache_clear()
         try:
             self.trie_ = datrie.Trie.load(fnm + ".trie")
             return
@@ -96,8 +131,22 @@ class RagTokenizer:
         self.loadDict_(fnm)
 
     def addUserDict(self, fnm):
+        self.cache_clear()
         self.loadDict_(fnm)
 
+    def cache_clear(self):
+        self._tokenize_cached.cache_clear()
+        self._fine_grained_tokenize_cached.cache_clear()
+
+    def cache_info(self):
+        res = {}
+        for nm, f in [("tokenize", self._tokenize_cached),
+                      ("fine_grained_tokenize", self._fine_grained_tokenize_cached)]:
+            info = f.cache_info()
+            res[nm] = {"hits": info.hits, "misses": info.misses, "size": info.currsize,
+                       "hit_rate": info.hits / (info.hits + info.misses) if info.hits + info.misses else 0.}
+        return res
+
     def _strQ2B(self, ustring):
         """Convert full-width characters to half-width characters"""
         rstring = ""
@@ -164,6 +213,57 @@ class RagTokenizer:
 
         return self.dfs_(chars, s + 1, preTks, tkslist)
 
+    def dp_(self, chars, beam=TOKENIZER_BEAM):
+        """
+        Segments `chars` over the same trie as dfs_, ranking with score_.
+        The `beam` best partial segmentations ending at every position are
+        kept, so the cost is linear in len(chars). Returns [(tks, score)],
+        best first, like sortTks_. The pruning of dfs_ depends on the tokens
+        before each position and isn't reproduced, so the best segmentation
+        may differ from the one of dfs_.
+        """
+        def score(F, L, N):
+            return 30 / N + L / N + F
+
+        # (F, number of tokens longer than 1, number of tokens, reversed tokens)
+        beams = [[] for _ in range(len(chars) + 1)]
+        beams[0] = [(0, 0, 0, None)]
+        for s in range(len(chars)):
+            if not beams[s]:
+                continue
+            if len(beams[s]) > beam:
+                beams[s] = sorted(beams[s], key=lambda b: score(*b[:3]), reverse=True)[:beam]
+            for e in range(s + 1, len(chars) + 1):
+                t = chars[s:e]
+                k = self.key_(t)
+                if e > s + 1 and not self.trie_.has_keys_with_prefix(k):
+                    break
+                if k in self.trie_:
+                    F = self.trie_[k][0]
+                elif e == s + 1:
+                    F = -12
+                else:
+                    continue
+                for pF, pL, pN, path in beams[s]:
+                    beams[e].append((pF + F, pL + (0 if len(t) < 2 else 1), pN + 1, (t, path)))
+            beams[s] = None
+
+        res = []
+        for F, L, N, path in beams[-1]:
+            tks = []
+            while path:
+                tks.append(path[0])
+                path = path[1]
+            res.append((tks[::-1], score(F, L, N)))
+        return sorted(res, key=lambda x: x[1], reverse=True)
+
+    def segment_(self, chars):
+        if self.SEGMENTER == "dp" or (self.SEGMENTER == "auto" and len(chars) > TOKENIZER_DFS_MAX_LEN):
+            return self.dp_(chars)
+        tkslist = []
+        self.dfs_(chars, 0, [], tkslist)
+        return self.sortTks_(tkslist)
+
     def freq(self, tk):
         k = self.key_(tk)
         if k not in self.trie_:
@@ -287,6 +387,11 @@ class RagTokenizer:
         return txt_lang_pairs
 
     def tokenize(self, line):
+        if len(line) > TOKENIZER_CACHE_MAX_LEN:
+            return self._tokenize(line)
+        return self._tokenize_cached(line)
+
+    def _tokenize(self, line):
         line = re.sub(r"\W+", " ", line)
         line = self._strQ2B(line).lower()
         line = self._tradi2simp(line)
@@ -334,9 +439,7 @@ class RagTokenizer:
                     j += 1
                     continue
                 # backward tokens from_i to i are different from forward tokens from _j to j.
-                tkslist = []
-                self.dfs_("".join(tks[_j:j]), 0, [], tkslist)
-                res.append(" ".join(self.sortTks_(tkslist)[0][0]))
+                res.append(" ".join(self.segment_("".join(tks[_j:j]))[0][0]))
 
                 same = 1
                 while i + same < len(tks1) and j + same < len(tks) and tks1[i + same] == tks[j + same]:
@@ -350,15 +453,18 @@ class RagTokenizer:
             if _i < len(tks1):
                 assert _j < len(tks)
                 assert "".join(tks1[_i:]) == "".join(tks[_j:])
-                tkslist = []
-                self.dfs_("".join(tks[_j:]), 0, [], tkslist)
-                res.append(" ".join(self.sortTks_(tkslist)[0][0]))
+                res.append(" ".join(self.segment_("".join(tks[_j:]))[0][0]))
 
         res = " ".join(res)
         logging.debug("[TKS] {}".format(self.merge_(res)))
         return self.merge_(res)
 
     def fine_grained_tokenize(self, tks):
+        if len(tks) > TOKENIZER_CACHE_MAX_LEN:
+            return self._fine_grained_tokenize(tks)
+        return self._fine_grained_tokenize_cached(tks)
+
+    def _fine_grained_tokenize(self, tks):
         tks = tks.split()
         zh_num = len([1 for c in tks if c and is_chinese(c[0])])
         if zh_num < len(tks) * 0.2:
@@ -372,15 +478,14 @@ class RagTokenizer:
             if len(tk) < 3 or re.match(r"[0-9,\.-]+$", tk):
                 res.append(tk)
                 continue
-            tkslist = []
             if len(tk) > 10:
-                tkslist.append(tk)
-            else:
-                self.dfs_(tk, 0, [], tkslist)
+                res.append(tk)
+                continue
+            tkslist = self.segment_(tk)
             if len(tkslist) < 2:
                 res.append(tk)
                 continue
-            stk = self.sortTks_(tkslist)[1][0]
+            stk = tkslist[1][0]
             if len(stk) == len(tk):
                 stk = tk
             else:
@@ -398,6 +503,46 @@ class RagTokenizer:
 
         return " ".join(self.english_normalize_(res))
 
+    def tokenize_batch(self, lines, fine_grained=False, processes=0):
+        """
+        Tokenizes `lines`, each distinct string once and through the caches of
+        tokenize and fine_grained_tokenize. Returns the tokens of every line, or
+        (tokens, fine grained tokens) pairs if `fine_grained`.
+        With `processes` > 1 and at least TOKENIZER_POOL_MIN_LINES distinct
+        strings, they are spread over a pool of forked processes, which share
+        this tokenizer's dictionary. Forking is off by default since the caller
+        may hold threads and locks a forked child doesn't get back.
+        """
+        uniq = list(dict.fromkeys(lines))
+        if processes > 1 and len(uniq) >= TOKENIZER_POOL_MIN_LINES \
+                and "fork" in multiprocessing.get_all_start_methods():
+            global _POOL_TOKENIZER
+            _POOL_TOKENIZER = self
+            try:
+                with multiprocessing.get_context("fork").Pool(processes) as pool:
+                    res = pool.map(functools.partial(_tokenize_worker, fine_grained=fine_grained), uniq,
+                                   chunksize=max(1, len(uniq) // (processes * 4)))
+            finally:
+                _POOL_TOKENIZER = None
+        else:
+            res = [_tokenize_with(self, line, fine_grained) for line in uniq]
+        res = dict(zip(uniq, res))
+        return [res[line] for line in lines]
+
+
+_POOL_TOKENIZER = None
+
+
+def _tokenize_with(tknzr, line, fine_grained):
+    tks = tknzr.tokenize(line)
+    if not fine_grained:
+        return tks
+    return tks, tknzr.fine_grained_tokenize(tks)
+
+
+def _tokenize_worker(line, fine_grained=False):
+    return _tokenize_with(_POOL_TOKENIZER, line, fine_grained)
+
 
 def is_chinese(s):
     if s >= u'\u4e00' and s <= u'\u9fa5':
@@ -434,6 +579,8 @@ def naiveQie(txt):
 tokenizer = RagTokenizer()
 tokenize = tokenizer.tokenize
 fine_grained_tokenize = tokenizer.fine_grained_tokenize
+tokenize_batch = tokenizer.tokenize_batch
+cache_info = tokenizer.cache_info
 tag = tokenizer.tag
 freq = tokenizer.freq
 loadUserDict = tokenizer.loadUserDict
@@ -13,24 +13,101 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import ast
+import copy
+import functools
+import itertools
+import json
 import logging
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass
 
-from rag.settings import TAG_FLD, PAGERANK_FLD
+from rag.settings import TAG_FLD, PAGERANK_FLD, VECTOR_SIMILARITY_FLD
 from rag.utils import rmSpace
 from rag.nlp import rag_tokenizer, query
 import numpy as np
-from rag.utils.doc_store_conn import DocStoreConnection, MatchDenseExpr, FusionExpr, OrderByExpr
+from rag.utils.doc_store_conn import DocStoreConnection, MatchDenseExpr, FusionExpr, OrderByExpr, get_kb_versions
+
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", "1024"))
+RETRIEVAL_CACHE_TTL = int(os.environ.get("RETRIEVAL_CACHE_TTL", "600"))
+# let the doc store score the hits against the query vector instead of returning their vectors
+VECTOR_SIMILARITY_IN_STORE = os.environ.get("VECTOR_SIMILARITY_IN_STORE", "0") == "1"
+# send the relaxed search of a hybrid search along with it rather than after it returns nothing
+SPECULATIVE_FALLBACK = os.environ.get("SPECULATIVE_FALLBACK", "0") == "1"
+SEARCH_THREADS = int(os.environ.get("SEARCH_THREADS", "16"))
+# search each index, or each index and knowledge base, on its own: "", "index" or "kb"
+SEARCH_FAN_OUT = os.environ.get("SEARCH_FAN_OUT", "")
+SEARCH_FAN_OUT_TIMEOUT = float(os.environ.get("SEARCH_FAN_OUT_TIMEOUT", "10"))
+CITATION_TOKEN_CACHE_SIZE = int(os.environ.get("CITATION_TOKEN_CACHE_SIZE", "4096"))
+CHUNK_SCAN_BATCH = int(os.environ.get("CHUNK_SCAN_BATCH", "1000"))
 
 
 def index_name(uid): return f"ragflow_{uid}"
 
 
+def _model_key(mdl):
+    if mdl is None:
+        return None
+    return [getattr(mdl, "tenant_id", None), getattr(mdl, "model_name", getattr(mdl, "llm_name", type(mdl).__name__))]
+
+
+def tag_features(v):
+    """
+    The {tag: score} of a chunk's TAG_FLD. The stores return it decoded, a
+    string is JSON, or the Python literal older versions of the Elasticsearch
+    connection returned. Anything else counts as no tags.
+    """
+    if isinstance(v, dict):
+        return v
+    if not v or not isinstance(v, str):
+        return {}
+    try:
+        v = json.loads(v)
+    except ValueError:
+        try:
+            v = ast.literal_eval(v)
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            return {}
+    return v if isinstance(v, dict) else {}
+
+
+class _QueryEmbedding:
+    """Hands the searches of a fan-out the query vector embedded once."""
+
+    def __init__(self, vector):
+        self.vector = vector
+
+    def encode_queries(self, query):
+        return self.vector, 0
+
+
 class Dealer:
     def __init__(self, dataStore: DocStoreConnection):
         self.qryr = query.FulltextQueryer()
         self.dataStore = dataStore
+        # retrieval results by question and parameters, with the versions of the knowledge bases they were read from
+        self.retrieval_cache = OrderedDict()
+        self.retrieval_cache_lock = threading.Lock()
+        self.retrieval_cache_stats = {"hits": 0, "misses": 0, "stale": 0}
+        self.search_pool = ThreadPoolExecutor(max_workers=SEARCH_THREADS, thread_name_prefix="dealer_search") \
+            if SPECULATIVE_FALLBACK else None
+        self.search_stats_lock = threading.Lock()
+        self.search_stats = {"hybrid": 0, "fallback": 0, "speculative_unused": 0}
+        self.fan_out_pool = ThreadPoolExecutor(max_workers=SEARCH_THREADS, thread_name_prefix="dealer_fan_out") \
+            if SEARCH_FAN_OUT else None
+        # per index: searches, timeouts, errors and their total seconds
+        self.fan_out_stats = {}
+        # per index: searches which timed out and still hold a worker of fan_out_pool
+        self.fan_out_stuck = {}
+        # the index of every knowledge base seen by a fan-out over knowledge bases, which never changes
+        self.kb_index = {}
+        # the chunks retrieved for a conversation are cited turn after turn
+        self.citation_tokens = functools.lru_cache(maxsize=CITATION_TOKEN_CACHE_SIZE)(self.citation_tokens)
 
     @dataclass
     class SearchResult:
@@ -65,11 +142,150 @@ class Dealer:
         return condition
 
     def search(self, req, idx_names: str | list[str],
-               kb_ids: list[str],
+               kb_ids: list[str] | None,
                emb_mdl=None,
                highlight=False,
                rank_feature: dict | None = None
                ):
+        """
+        Searches the indices at once, or, with SEARCH_FAN_OUT, each index (and
+        knowledge base) in its own concurrent search, see _fan_out_search.
+        """
+        if isinstance(idx_names, str):
+            idx_names = idx_names.split(",")
+        if not self.fan_out_pool or not req.get("question") or (SEARCH_FAN_OUT == "kb" and not kb_ids):
+            return self._search(req, idx_names, kb_ids, emb_mdl, highlight, rank_feature)
+        groups = [([idx], kb_ids) for idx in idx_names]
+        if SEARCH_FAN_OUT == "kb":
+            groups = [([idx], [kb_id]) for idx in idx_names for kb_id in self._kb_ids_in(idx, kb_ids)]
+        if len(groups) < 2:
+            return self._search(req, idx_names, kb_ids, emb_mdl, highlight, rank_feature)
+        return self._fan_out_search(groups, req, emb_mdl, highlight, rank_feature)
+
+    def _kb_ids_in(self, idx, kb_ids):
+        """Those of kb_ids stored in the index, asking the store about the ones not seen yet."""
+        unknown = [kb_id for kb_id in kb_ids if kb_id not in self.kb_index]
+        if unknown:
+            found = self.dataStore.knowledgebaseIdsIn(idx, unknown)
+            with self.search_stats_lock:
+                self.kb_index.update({kb_id: idx for kb_id in found})
+        return [kb_id for kb_id in kb_ids if self.kb_index.get(kb_id) == idx]
+
+    def _fan_out_search(self, groups, req, emb_mdl, highlight, rank_feature):
+        """
+        Runs _search on every group of indices and knowledge bases concurrently,
+        see _fan_out. Each group returns its top page*size hits, without falling
+        back to the relaxed search; only when no group has a hit are the groups
+        searched again with the relaxed search. The store scores are min-max
+        normalized per group, since scores of different indices don't compare,
+        and the page is cut from the hits merged by normalized score.
+        """
+        pg = int(req.get("page", 1)) - 1
+        ps = int(req.get("size", int(req.get("topk", 1024))))
+        sub_req = dict(req, page=1, size=(pg + 1) * ps)
+        if emb_mdl is not None:
+            emb_mdl = _QueryEmbedding(emb_mdl.encode_queries(req["question"])[0])
+
+        results = self._fan_out(groups, sub_req, emb_mdl, highlight, rank_feature, relax=False)
+        used_fallback = emb_mdl is not None and results and not any(sres.total for sres in results)
+        if used_fallback:
+            results = self._fan_out(groups, sub_req, emb_mdl, highlight, rank_feature, relax=True)
+        if emb_mdl is not None:
+            with self.search_stats_lock:
+                self.search_stats["hybrid"] += 1
+                self.search_stats["fallback"] += int(used_fallback)
+
+        hits, aggs = [], {}
+        for sres in results:
+            scores = [float(sres.field[i].pop("_score", None) or 0) for i in sres.ids]
+            lo, hi = min(scores, default=0), max(scores, default=0)
+            hits.extend([((s - lo) / (hi - lo) if hi > lo else s, i, sres) for s, i in zip(scores, sres.ids)])
+            for k, c in sres.aggregation or []:
+                aggs[k] = aggs.get(k, 0) + c
+        hits = sorted(hits, key=lambda x: x[0] * -1)[pg * ps: (pg + 1) * ps]
+        keywords = [sres.keywords for sres in results if sres.keywords]
+        return self.SearchResult(
+            total=sum([sres.total for sres in results]),
+            ids=[i for _, i, _ in hits],
+            query_vector=results[0].query_vector if results else [],
+            aggregation=sorted(aggs.items(), key=lambda x: x[1] * -1),
+            highlight={i: sres.highlight[i] for _, i, sres in hits if sres.highlight and i in sres.highlight},
+            field={i: sres.field[i] for _, i, sres in hits},
+            keywords=keywords[0] if keywords else []
+        )
+
+    def _fan_out(self, groups, req, emb_mdl, highlight, rank_feature, relax):
+        """
+        Submits _search for every group to fan_out_pool and returns the results
+        of those which answered. Each group gets SEARCH_FAN_OUT_TIMEOUT seconds
+        from the moment it starts, or from its submission while it waits for a
+        worker; a waiting group which times out is cancelled. A running one can't
+        be, so an index is skipped while a search of it which timed out still
+        holds a worker, rather than piling up more of them.
+        """
+        def run(i, idx_names, kb_ids):
+            started[i] = st = time.time()
+            try:
+                return self._search(copy.deepcopy(req), idx_names, kb_ids, emb_mdl, highlight, rank_feature,
+                                    with_scores=True, relax=relax)
+            finally:
+                self._record_fan_out(idx_names[0], "searches", time.time() - st)
+
+        def release(idx):
+            with self.search_stats_lock:
+                self.fan_out_stuck[idx] -= 1
+
+        started, pending = {}, {}
+        for i, (idx_names, kb_ids) in enumerate(groups):
+            if self.fan_out_stuck.get(idx_names[0]):
+                logging.warning(f"Dealer.search skips {idx_names[0]}, a former search of it hasn't returned")
+                self._record_fan_out(idx_names[0], "timeouts")
+                continue
+            pending[i] = (idx_names[0], time.time(), self.fan_out_pool.submit(run, i, idx_names, kb_ids))
+
+        results = {}
+        while pending:
+            now = time.time()
+            for i, (idx, submitted, future) in list(pending.items()):
+                if future.done():
+                    del pending[i]
+                    try:
+                        results[i] = future.result()
+                    except Exception:
+                        logging.exception(f"Dealer.search {idx} failed")
+                        self._record_fan_out(idx, "errors")
+                elif now - started.get(i, submitted) >= SEARCH_FAN_OUT_TIMEOUT:
+                    del pending[i]
+                    logging.warning(f"Dealer.search {idx} timed out after {SEARCH_FAN_OUT_TIMEOUT}s")
+                    self._record_fan_out(idx, "timeouts")
+                    if not future.cancel():
+                        with self.search_stats_lock:
+                            self.fan_out_stuck[idx] = self.fan_out_stuck.get(idx, 0) + 1
+                        future.add_done_callback(lambda _, idx=idx: release(idx))
+            if pending:
+                deadline = min([started.get(i, submitted) for i, (_, submitted, _) in pending.items()])
+                wait([future for _, _, future in pending.values()],
+                     timeout=max(deadline + SEARCH_FAN_OUT_TIMEOUT - time.time(), 0), return_when=FIRST_COMPLETED)
+        return [results[i] for i in sorted(results)]
+
+    def _record_fan_out(self, idx, key, elapsed=0.0):
+        with self.search_stats_lock:
+            stats = self.fan_out_stats.setdefault(idx, {"searches": 0, "timeouts": 0, "errors": 0, "seconds": 0.0})
+            stats[key] += 1
+            stats["seconds"] += elapsed
+
+    def _search(self, req, idx_names: str | list[str],
+                kb_ids: list[str],
+                emb_mdl=None,
+                highlight=False,
+                rank_feature: dict | None = None,
+                with_scores=False,
+                relax=None
+                ):
+        """
+        With `relax` None, a hybrid search which finds nothing falls back to the
+        relaxed search; False runs the hybrid search only, True the relaxed one.
+        """
         filters = self.get_filters(req)
         orderBy = OrderByExpr()
 
@@ -83,6 +299,8 @@ class Dealer:
                        "doc_id", "page_num_int", "top_int", "create_timestamp_flt", "knowledge_graph_kwd",
                        "question_kwd", "question_tks",
                        "available_int", "content_with_weight", PAGERANK_FLD, TAG_FLD])
+        if with_scores:
+            src = src + ["_score"]
         kwds = set([])
 
         qst = req.get("question", "")
@@ -107,25 +325,45 @@ class Dealer:
             else:
                 matchDense = self.get_vector(qst, emb_mdl, topk, req.get("similarity", 0.1))
                 q_vec = matchDense.embedding_data
-                src.append(f"q_{len(q_vec)}_vec")
+                src.append(VECTOR_SIMILARITY_FLD if VECTOR_SIMILARITY_IN_STORE else f"q_{len(q_vec)}_vec")
 
                 fusionExpr = FusionExpr("weighted_sum", topk, {"weights": "0.05, 0.95"})
                 matchExprs = [matchText, matchDense, fusionExpr]
 
-                res = self.dataStore.search(src, highlightFields, filters, matchExprs, orderBy, offset, limit,
-                                            idx_names, kb_ids, rank_feature=rank_feature)
+                # the stores fill in the expressions and the filters, so each search gets its own
+                fallback = None
+                if self.search_pool and relax is None:
+                    fallback = self.search_pool.submit(self._fallback_search, qst, src, highlightFields,
+                                                       copy.deepcopy(filters), copy.deepcopy(matchDense),
+                                                       copy.deepcopy(fusionExpr), orderBy, offset, limit,
+                                                       idx_names, kb_ids, rank_feature)
+                if relax:
+                    res = self._fallback_search(qst, src, highlightFields, filters, matchDense, fusionExpr,
+                                                orderBy, offset, limit, idx_names, kb_ids, rank_feature)
+                else:
+                    res = self.dataStore.search(src, highlightFields, filters, matchExprs, orderBy, offset, limit,
+                                                idx_names, kb_ids, rank_feature=rank_feature)
                 total = self.dataStore.getTotal(res)
                 logging.debug("Dealer.search TOTAL: {}".format(total))
 
                 # If result is empty, try again with lower min_match
-                if total == 0:
-                    matchText, _ = self.qryr.question(qst, min_match=0.1)
-                    filters.pop("doc_ids", None)
-                    matchDense.extra_options["similarity"] = 0.17
-                    res = self.dataStore.search(src, highlightFields, filters, [matchText, matchDense, fusionExpr],
-                                                orderBy, offset, limit, idx_names, kb_ids, rank_feature=rank_feature)
+                used_fallback = total == 0 and relax is None
+                if used_fallback:
+                    if fallback:
+                        res = fallback.result()
+                    else:
+                        res = self._fallback_search(qst, src, highlightFields, filters, matchDense, fusionExpr,
+                                                    orderBy, offset, limit, idx_names, kb_ids, rank_feature)
                     total = self.dataStore.getTotal(res)
                     logging.debug("Dealer.search 2 TOTAL: {}".format(total))
+                elif fallback:
+                    fallback.cancel()
+                # the fan-out counts its searches itself
+                if relax is None:
+                    with self.search_stats_lock:
+                        self.search_stats["hybrid"] += 1
+                        self.search_stats["fallback"] += int(used_fallback)
+                        self.search_stats["speculative_unused"] += int(fallback is not None and not used_fallback)
 
             for k in keywords:
                 kwds.add(k)
@@ -151,6 +389,30 @@ class Dealer:
             keywords=keywords
         )
 
+    def _fallback_search(self, qst, src, highlightFields, filters, matchDense, fusionExpr, orderBy, offset, limit,
+                         idx_names, kb_ids, rank_feature):
+        """The relaxed hybrid search, for when the one of Dealer.search finds nothing."""
+        matchText, _ = self.qryr.question(qst, min_match=0.1)
+        filters.pop("doc_ids", None)
+        matchDense.extra_options["similarity"] = 0.17
+        return self.dataStore.search(src, highlightFields, filters, [matchText, matchDense, fusionExpr],
+                                     orderBy, offset, limit, idx_names, kb_ids, rank_feature=rank_feature)
+
+    def search_info(self):
+        """
+        How many hybrid searches ran, how many fell back to the relaxed search,
+        speculative searches unused, and the searches, timeouts, errors and
+        latency of each index searched by a fan-out.
+        """
+        with self.search_stats_lock:
+            info = dict(self.search_stats)
+            fan_out = {idx: dict(stats) for idx, stats in self.fan_out_stats.items()}
+        info["fallback_rate"] = info["fallback"] / info["hybrid"] if info["hybrid"] else 0.0
+        for stats in fan_out.values():
+            stats["mean_seconds"] = stats["seconds"] / stats["searches"] if stats["searches"] else 0.0
+        info["fan_out"] = fan_out
+        return info
+
     @staticmethod
     def trans2floats(txt):
         return [float(t) for t in txt.split("\t")]
@@ -206,25 +468,26 @@ class Dealer:
         assert len(ans_v[0]) == len(chunk_v[0]), "The dimension of query and chunk do not match: {} vs. {}".format(
             len(ans_v[0]), len(chunk_v[0]))
 
-        chunks_tks = [rag_tokenizer.tokenize(self.qryr.rmWWW(ck)).split()
-                      for ck in chunks]
+        from sklearn.metrics.pairwise import cosine_similarity as CosineSimilarity
+
+        # hybrid_similarity of every piece against every chunk, in one product each
+        chunks_tks = [self.citation_tokens(ck) for ck in chunks]
+        pieces_tks = [rag_tokenizer.tokenize(self.qryr.rmWWW(p)).split() for p in pieces_]
+        vtsim = CosineSimilarity(ans_v, chunk_v)
+        tksim = self.qryr.token_similarity_matrix(pieces_tks, chunks_tks)
+        sim = np.where(np.sum(vtsim, axis=1, keepdims=True) == 0, tksim, vtsim * vtweight + tksim * tkweight)
+        mxs = np.max(sim, axis=1) * 0.99
+        logging.debug("{} SIM: {}".format(pieces_, mxs))
+
+        # the highest threshold of 0.63, 0.63 * 0.8, ... above 0.3 any piece reaches
         cites = {}
         thr = 0.63
-        while thr > 0.3 and len(cites.keys()) == 0 and pieces_ and chunks_tks:
-            for i, a in enumerate(pieces_):
-                sim, tksim, vtsim = self.qryr.hybrid_similarity(ans_v[i],
-                                                                chunk_v,
-                                                                rag_tokenizer.tokenize(
-                                                                    self.qryr.rmWWW(pieces_[i])).split(),
-                                                                chunks_tks,
-                                                                tkweight, vtweight)
-                mx = np.max(sim) * 0.99
-                logging.debug("{} SIM: {}".format(pieces_[i], mx))
-                if mx < thr:
-                    continue
-                cites[idx[i]] = list(
-                    set([str(ii) for ii in range(len(chunk_v)) if sim[ii] > mx]))[:4]
+        while thr > 0.3 and not np.any(mxs >= thr):
             thr *= 0.8
+        if thr > 0.3:
+            for i in np.nonzero(mxs >= thr)[0]:
+                cites[idx[i]] = list(
+                    set([str(ii) for ii in range(len(chunk_v)) if sim[i][ii] > mxs[i]]))[:4]
 
         res = ""
         seted = set([])
@@ -244,9 +507,11 @@ class Dealer:
 
         return res, seted
 
+    def citation_tokens(self, content_ltks):
+        return tuple(rag_tokenizer.tokenize(self.qryr.rmWWW(content_ltks)).split())
+
     def _rank_feature_scores(self, query_rfea, search_res):
         ## For rank feature(tag_fea) scores.
-        rank_fea = []
         pageranks = []
         for chunk_id in search_res.ids:
             pageranks.append(search_res.field[chunk_id].get(PAGERANK_FLD, 0))
@@ -255,35 +520,44 @@ class Dealer:
         if not query_rfea:
             return np.array([0 for _ in range(len(search_res.ids))]) + pageranks
 
+        # cosine of the query tags to the tags of every chunk, over all (chunk, tag) pairs at once
         q_denor = np.sqrt(np.sum([s*s for t,s in query_rfea.items() if t != PAGERANK_FLD]))
-        for i in search_res.ids:
-            nor, denor = 0, 0
-            for t, sc in eval(search_res.field[i].get(TAG_FLD, "{}")).items():
-                if t in query_rfea:
-                    nor += query_rfea[t] * sc
-                denor += sc * sc
-            if denor == 0:
-                rank_fea.append(0)
-            else:
-                rank_fea.append(nor/np.sqrt(denor)/q_denor)
-        return np.array(rank_fea)*10. + pageranks
+        rows, tags, scores = [], [], []
+        for row, i in enumerate(search_res.ids):
+            for t, sc in tag_features(search_res.field[i].get(TAG_FLD)).items():
+                rows.append(row)
+                tags.append(t)
+                scores.append(sc)
+        if not rows or q_denor == 0:
+            return np.zeros(len(search_res.ids)) + pageranks
+        rows = np.array(rows)
+        scores = np.array(scores, dtype=float)
+        qw = np.array([query_rfea.get(t, 0) for t in tags], dtype=float)
+        nor = np.bincount(rows, weights=qw * scores, minlength=len(search_res.ids))
+        denor = np.bincount(rows, weights=scores * scores, minlength=len(search_res.ids))
+        rank_fea = np.divide(nor, np.sqrt(denor) * q_denor, out=np.zeros(len(search_res.ids)), where=denor > 0)
+        return rank_fea*10. + pageranks
 
     def rerank(self, sres, query, tkweight=0.3,
                vtweight=0.7, cfield="content_ltks",
                rank_feature: dict | None = None
                ):
         _, keywords = self.qryr.question(query)
+        if not sres.ids:
+            return [], [], []
         vector_size = len(sres.query_vector)
         vector_column = f"q_{vector_size}_vec"
         zero_vector = [0.0] * vector_size
+        in_store = any([VECTOR_SIMILARITY_FLD in sres.field[chunk_id] for chunk_id in sres.ids])
         ins_embd = []
         for chunk_id in sres.ids:
+            if in_store:
+                ins_embd.append(float(sres.field[chunk_id].get(VECTOR_SIMILARITY_FLD) or 0))
+                continue
             vector = sres.field[chunk_id].get(vector_column, zero_vector)
             if isinstance(vector, str):
                 vector = [float(v) for v in vector.split("\t")]
             ins_embd.append(vector)
-        if not ins_embd:
-            return [], [], []
 
         for i in sres.ids:
             if isinstance(sres.field[i].get("important_kwd", []), str):
@@ -300,10 +574,13 @@ class Dealer:
         ## For rank feature(tag_fea) scores.
         rank_fea = self._rank_feature_scores(rank_feature, sres)
 
-        sim, tksim, vtsim = self.qryr.hybrid_similarity(sres.query_vector,
-                                                        ins_embd,
-                                                        keywords,
-                                                        ins_tw, tkweight, vtweight)
+        if in_store:
+            sim, tksim, vtsim = self.qryr.hybrid_similarity_of(np.array(ins_embd), keywords, ins_tw, tkweight, vtweight)
+        else:
+            sim, tksim, vtsim = self.qryr.hybrid_similarity(sres.query_vector,
+                                                            ins_embd,
+                                                            keywords,
+                                                            ins_tw, tkweight, vtweight)
 
         return sim + rank_fea, tksim, vtsim
 
@@ -340,6 +617,57 @@ class Dealer:
                   vector_similarity_weight=0.3, top=1024, doc_ids=None, aggs=True,
                   rerank_mdl=None, highlight=False,
                   rank_feature: dict | None = {PAGERANK_FLD: 10}):
+        """
+        Cached _retrieval. A cached result is served only while the versions of
+        its knowledge bases, incremented by every write of the doc store, are
+        the ones it was read at. Results read right after a write, which the
+        store may not show yet, are not cached.
+        """
+        args = (question, embd_mdl, tenant_ids, kb_ids, page, page_size, similarity_threshold,
+                vector_similarity_weight, top, doc_ids, aggs, rerank_mdl, highlight, rank_feature)
+        if not question or RETRIEVAL_CACHE_SIZE <= 0:
+            return self._retrieval(*args)
+        tids = tenant_ids.split(",") if isinstance(tenant_ids, str) else tenant_ids
+        versions, settled = get_kb_versions(kb_ids or [], [index_name(tid) for tid in tids])
+        if versions is None:
+            return self._retrieval(*args)
+
+        key = json.dumps([re.sub(r"\s+", " ", question).strip(), _model_key(embd_mdl), sorted(tids), sorted(kb_ids or []),
+                          sorted(doc_ids or []), page, page_size, similarity_threshold, vector_similarity_weight, top,
+                          aggs, _model_key(rerank_mdl), highlight, rank_feature], ensure_ascii=False, default=str)
+        with self.retrieval_cache_lock:
+            cached = self.retrieval_cache.get(key)
+            if cached and cached[0] == versions and time.time() - cached[1] < RETRIEVAL_CACHE_TTL:
+                self.retrieval_cache.move_to_end(key)
+                self.retrieval_cache_stats["hits"] += 1
+                # callers reshape the chunks they get
+                return copy.deepcopy(cached[2])
+            if cached and cached[0] != versions:
+                self.retrieval_cache_stats["stale"] += 1
+            self.retrieval_cache_stats["misses"] += 1
+
+        ranks = self._retrieval(*args)
+        if settled:
+            with self.retrieval_cache_lock:
+                self.retrieval_cache[key] = (versions, time.time(), copy.deepcopy(ranks))
+                self.retrieval_cache.move_to_end(key)
+                while len(self.retrieval_cache) > RETRIEVAL_CACHE_SIZE:
+                    self.retrieval_cache.popitem(last=False)
+        return ranks
+
+    def retrieval_cache_info(self):
+        """Hits, misses, and stale: the misses which found a result from before a change of its knowledge bases."""
+        with self.retrieval_cache_lock:
+            info = dict(self.retrieval_cache_stats)
+            info["size"] = len(self.retrieval_cache)
+        total = info["hits"] + info["misses"]
+        info["hit_rate"] = info["hits"] / total if total else 0.0
+        return info
+
+    def _retrieval(self, question, embd_mdl, tenant_ids, kb_ids, page, page_size, similarity_threshold=0.2,
+                   vector_similarity_weight=0.3, top=1024, doc_ids=None, aggs=True,
+                   rerank_mdl=None, highlight=False,
+                   rank_feature: dict | None = {PAGERANK_FLD: 10}):
         ranks = {"total": 0, "chunks": [], "doc_aggs": {}}
         if not question:
             return ranks
@@ -422,6 +750,16 @@ class Dealer:
                                                                    key=lambda x: x[1]["count"] * -1)]
         ranks["chunks"] = ranks["chunks"][:page_size]
 
+        # the vectors left out of the search are fetched for the returned chunks only
+        missing = [d for d in ranks["chunks"] if d["vector"] is zero_vector]
+        if dim and missing and VECTOR_SIMILARITY_IN_STORE:
+            res = self.dataStore.search([vector_column], [], {"id": [d["chunk_id"] for d in missing]}, [],
+                                        OrderByExpr(), 0, len(missing), [index_name(tid) for tid in tenant_ids],
+                                        kb_ids)
+            vectors = self.dataStore.getFields(res, [vector_column])
+            for d in missing:
+                d["vector"] = vectors.get(d["chunk_id"], {}).get(vector_column, zero_vector)
+
         return ranks
 
     def sql_retrieval(self, sql, fetch_size=128, format="json"):
@@ -432,20 +770,18 @@ class Dealer:
                    kb_ids: list[str], max_count=1024,
                    offset=0,
                    fields=["docnm_kwd", "content_with_weight", "img_id"]):
-        condition = {"doc_id": doc_id}
-        res = []
-        bs = 128
-        for p in range(offset, max_count, bs):
-            es_res = self.dataStore.search(fields, [], condition, [], OrderByExpr(), p, bs, index_name(tenant_id),
-                                           kb_ids)
-            dict_chunks = self.dataStore.getFields(es_res, fields)
-            for id, doc in dict_chunks.items():
-                doc["id"] = id
-            if dict_chunks:
-                res.extend(dict_chunks.values())
-            if len(dict_chunks.values()) < bs:
-                break
-        return res
+        """The chunks of the document from offset up to max_count. Use iter_chunks to read them all."""
+        return list(itertools.islice(
+            self.iter_chunks(doc_id, tenant_id, kb_ids, fields, batch_size=max(1, min(CHUNK_SCAN_BATCH, max_count))),
+            offset, max_count))
+
+    def iter_chunks(self, doc_id: str, tenant_id: str, kb_ids: list[str],
+                    fields=["docnm_kwd", "content_with_weight", "img_id"], batch_size=CHUNK_SCAN_BATCH):
+        """
+        Yields every chunk of the document, with its id and the fields, reading
+        batch_size chunks per request with DocStoreConnection.scan.
+        """
+        yield from self.dataStore.scan(fields, {"doc_id": doc_id}, index_name(tenant_id), kb_ids, batch_size)
 
     def all_tags(self, tenant_id: str, kb_ids: list[str], S=1000):
         if not self.dataStore.indexExist(index_name(tenant_id), kb_ids[0]):
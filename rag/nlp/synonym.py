@@ -19,8 +19,8 @@ import json
 import os
 import time
 import re
-from nltk.corpus import wordnet
 from api.utils.file_utils import get_project_base_directory
+from rag.nlp import wordnet_synonym
 
 
 class Dealer:
@@ -28,6 +28,8 @@ class Dealer:
 
         self.lookup_num = 100000000
         self.load_tm = time.time() - 1000000
+        # bumped whenever the dictionary is replaced, for caches built on lookups
+        self.version = 0
         self.dictionary = None
         path = os.path.join(get_project_base_directory(), "rag/res", "synonym.json")
         try:
@@ -36,6 +38,11 @@ class Dealer:
             logging.warning("Missing synonym.json")
             self.dictionary = {}
 
+        # built by rag/nlp/wordnet_synonym.py, saves loading WordNet at query time
+        self.wordnet = wordnet_synonym.load()
+        if self.wordnet is None:
+            logging.info("Missing wordnet_synonym.json, English synonyms are looked up in WordNet")
+
         if not redis:
             logging.warning(
                 "Realtime synonym is disabled, since no redis connection.")
@@ -62,14 +69,21 @@ class Dealer:
             return
         try:
             d = json.loads(d)
-            self.dictionary = d
+            if d != self.dictionary:
+                self.dictionary = d
+                self.version += 1
         except Exception as e:
             logging.error("Fail to load synonym!" + str(e))
 
+    def refresh(self):
+        self.lookup_num += 1
+        self.load()
+
     def lookup(self, tk, topn=8):
         if re.match(r"[a-z]+$", tk):
-            res = list(set([re.sub("_", " ", syn.name().split(".")[0]) for syn in wordnet.synsets(tk)]) - set([tk]))
-            return [t for t in res if t]
+            if self.wordnet is not None:
+                return list(self.wordnet.get(tk, ()))
+            return wordnet_synonym.wordnet_lookup(tk)
 
         self.lookup_num += 1
         self.load()
@@ -0,0 +1,77 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+import random
+import re
+from timeit import default_timer as timer
+
+from deepdoc.parser.utils import get_text
+from rag.nlp import wordnet_synonym
+
+
+def main(args):
+    start = timer()
+    table = wordnet_synonym.load(args.table)
+    if table is None:
+        print(f"{args.table} is missing, build it with: python rag/nlp/wordnet_synonym.py")
+        return
+    print(f"load table: {len(table)} words, {timer() - start:.3f}s")
+
+    if args.inputs:
+        words = sorted(set(re.findall(r"[a-z]+", get_text(args.inputs).lower())))
+    else:
+        words = wordnet_synonym.candidates()
+    random.seed(0)
+    words = random.sample(words, min(args.sample, len(words)))
+
+    start = timer()
+    live = [wordnet_synonym.wordnet_lookup(w) for w in words[:1]]
+    print(f"first WordNet lookup: {timer() - start:.3f}s")
+    start = timer()
+    live = [wordnet_synonym.wordnet_lookup(w) for w in words]
+    live_elapsed = timer() - start
+    start = timer()
+    offline = [list(table.get(w, ())) for w in words]
+    offline_elapsed = timer() - start
+    print(f"WordNet: {live_elapsed:.3f}s, table: {offline_elapsed:.3f}s for {len(words)} words")
+
+    # WordNet returns the synonyms in set order, which varies between processes
+    diff = [i for i in range(len(words)) if set(live[i]) != set(offline[i])]
+    print(f"table agrees with WordNet on {len(words) - len(diff)}/{len(words)} words")
+    for i in diff[:args.show]:
+        print(f"  {words[i]}: WordNet {sorted(live[i])}, table {sorted(offline[i])}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--inputs', help="A text file whose English words are looked up. Default: the words of the table")
+    parser.add_argument('--table', help="The table built by rag/nlp/wordnet_synonym.py", default=wordnet_synonym.TABLE_FILE)
+    parser.add_argument('--sample', help="Number of words to compare. Default: 20000", type=int, default=20000)
+    parser.add_argument('--show', help="Number of disagreements to print. Default: 5", type=int, default=5)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,70 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+from timeit import default_timer as timer
+
+from deepdoc.parser.utils import get_text
+from rag.nlp import rag_tokenizer, term_weight
+from rag.nlp.query import FulltextQueryer
+
+
+def main(args):
+    lines = [line for line in get_text(args.inputs).split("\n") if line.strip()]
+    tkss = [rag_tokenizer.tokenize(line).split() for line in lines]
+    tokens = sum([len(tks) for tks in tkss])
+    dealer = term_weight.Dealer()
+
+    for name in ["weights (cold)", "weights (warm)"]:
+        start = timer()
+        res = [dealer.weights(tks, preprocess=False) for tks in tkss]
+        elapsed = timer() - start
+        print(f"{name}: {elapsed:.3f}s, {tokens / elapsed:.1f} tokens/s")
+
+    start = timer()
+    batch = dealer.weights_batch(tkss)
+    elapsed = timer() - start
+    print(f"weights_batch: {elapsed:.3f}s, {tokens / elapsed:.1f} tokens/s")
+    if batch != res:
+        print("weights_batch differs from weights")
+    print("token weight cache:", dealer.token_weight.cache_info())
+
+    qryr = FulltextQueryer()
+    start = timer()
+    for tks in tkss[:args.queries]:
+        qryr.token_similarity(tks, tkss)
+    elapsed = timer() - start
+    print(f"token_similarity: {min(args.queries, len(tkss))} queries x {len(tkss)} chunks, {elapsed:.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--inputs', help="A text file, one chunk per line", required=True)
+    parser.add_argument('--queries', help="Number of lines used as queries for token_similarity. Default: 10",
+                        type=int, default=10)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,74 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+
+from deepdoc.parser.utils import get_text
+from rag.nlp import rag_tokenizer
+
+
+def run(lines, segmenter):
+    rag_tokenizer.tokenizer.SEGMENTER = segmenter
+    rag_tokenizer.tokenizer.cache_clear()
+    res, elapsed = [], []
+    for line in lines:
+        start = timer()
+        tks = rag_tokenizer.tokenize(line)
+        res.append((tks, rag_tokenizer.fine_grained_tokenize(tks)))
+        elapsed.append(timer() - start)
+    return res, np.array(elapsed)
+
+
+def main(args):
+    lines = [line for line in get_text(args.inputs).split("\n") if line.strip()]
+    outputs = {}
+    for segmenter in args.segmenters.split(","):
+        outputs[segmenter], elapsed = run(lines, segmenter)
+        print(f"{segmenter}: {elapsed.sum():.3f}s, p50 {np.percentile(elapsed, 50) * 1000:.2f}ms, "
+              f"p99 {np.percentile(elapsed, 99) * 1000:.2f}ms, max {elapsed.max() * 1000:.2f}ms")
+
+    base, *others = outputs.keys()
+    for segmenter in others:
+        same = [a[0] == b[0] for a, b in zip(outputs[base], outputs[segmenter])]
+        same_fine = [a[1] == b[1] for a, b in zip(outputs[base], outputs[segmenter])]
+        print(f"{segmenter} vs {base}: tokenize agrees on {np.mean(same):.2%} of {len(lines)} lines, "
+              f"fine_grained_tokenize on {np.mean(same_fine):.2%}")
+        for i in [i for i, s in enumerate(same) if not s][:args.show]:
+            print(f"  {base}: {outputs[base][i][0]}\n  {segmenter}: {outputs[segmenter][i][0]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--inputs', help="A text file, one sentence per line", required=True)
+    parser.add_argument('--segmenters', help="Segmenters to compare, the first is the reference. Default: dfs,dp,auto",
+                        default="dfs,dp,auto")
+    parser.add_argument('--show', help="Number of disagreements to print. Default: 5", type=int, default=5)
+    args = parser.parse_args()
+    main(args)
@@ -14,6 +14,7 @@
 #  limitations under the License.
 #
 
+import functools
 import logging
 import math
 import json
@@ -23,6 +24,8 @@ import numpy as np
 from rag.nlp import rag_tokenizer
 from api.utils.file_utils import get_project_base_directory
 
+TOKEN_WEIGHT_CACHE_SIZE = int(os.environ.get("TOKEN_WEIGHT_CACHE_SIZE", "262144"))
+
 
 class Dealer:
     def __init__(self):
@@ -58,6 +61,13 @@ class Dealer:
                                "啥",
                                "相关"])
 
+        # the weight of a token only depends on the token, so it is computed once
+        self.token_weight = functools.lru_cache(maxsize=TOKEN_WEIGHT_CACHE_SIZE)(self._token_weight)
+        self.version = 0
+        self.load()
+
+    def load(self):
+        """(Re)loads ner.json and term.freq, dropping the memoized weights."""
         def load_dict(fnm):
             res = {}
             f = open(fnm, "r")
@@ -80,6 +90,8 @@ class Dealer:
 
         fnm = os.path.join(get_project_base_directory(), "rag/res")
         self.ne, self.df = {}, {}
+        self.token_weight.cache_clear()
+        self.version += 1
         try:
             self.ne = json.load(open(os.path.join(fnm, "ner.json"), "r"))
         except Exception:
@@ -159,12 +171,8 @@ class Dealer:
                 tks.append(t)
         return tks
 
-    def weights(self, tks, preprocess=True):
-        def skill(t):
-            if t not in self.sk:
-                return 1
-            return 6
-
+    def _token_weight(self, t):
+        """Weight of a token before normalization, see `token_weight`."""
         def ner(t):
             if re.match(r"[0-9,.]{2,}$", t):
                 return 2
@@ -222,23 +230,28 @@ class Dealer:
 
         def idf(s, N): return math.log10(10 + ((N - s + 0.5) / (s + 0.5)))
 
-        tw = []
-        if not preprocess:
-            idf1 = np.array([idf(freq(t), 10000000) for t in tks])
-            idf2 = np.array([idf(df(t), 1000000000) for t in tks])
-            wts = (0.3 * idf1 + 0.7 * idf2) * \
-                np.array([ner(t) * postag(t) for t in tks])
-            wts = [s for s in wts]
-            tw = list(zip(tks, wts))
-        else:
-            for tk in tks:
-                tt = self.tokenMerge(self.pretoken(tk, True))
-                idf1 = np.array([idf(freq(t), 10000000) for t in tt])
-                idf2 = np.array([idf(df(t), 1000000000) for t in tt])
-                wts = (0.3 * idf1 + 0.7 * idf2) * \
-                    np.array([ner(t) * postag(t) for t in tt])
-                wts = [s for s in wts]
-                tw.extend(zip(tt, wts))
+        return (0.3 * np.float64(idf(freq(t), 10000000)) + 0.7 * np.float64(idf(df(t), 1000000000))) * (ner(t) * postag(t))
 
+    def weights(self, tks, preprocess=True):
+        if preprocess:
+            tks = [t for tk in tks for t in self.tokenMerge(self.pretoken(tk, True))]
+        tw = [(t, self.token_weight(t)) for t in tks]
         S = np.sum([s for _, s in tw])
         return [(t, s / S) for t, s in tw]
+
+    def weights_batch(self, tkss, preprocess=False):
+        """
+        `weights` of many token lists at once: every distinct token is weighted
+        once, and every list is normalized on a slice of one array.
+        """
+        if preprocess:
+            tkss = [[t for tk in tks for t in self.tokenMerge(self.pretoken(tk, True))] for tks in tkss]
+        uniq = {}
+        idx = np.array([uniq.setdefault(t, len(uniq)) for tks in tkss for t in tks], dtype=np.int64)
+        wts = np.array([self.token_weight(t) for t in uniq], dtype=np.float64)[idx]
+        res, i = [], 0
+        for tks in tkss:
+            w = wts[i: i + len(tks)]
+            res.append(list(zip(tks, w / np.sum(w))))
+            i += len(tks)
+        return res
@@ -0,0 +1,99 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import json
+import logging
+import os
+import re
+import sys
+from timeit import default_timer as timer
+
+from nltk.corpus import wordnet
+
+FORMAT_VERSION = 1
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../res/wordnet_synonym.json")
+
+
+def wordnet_lookup(tk):
+    """English synonyms of `tk` as synonym.Dealer.lookup has them from WordNet."""
+    res = list(set([re.sub("_", " ", syn.name().split(".")[0]) for syn in wordnet.synsets(tk)]) - set([tk]))
+    return [t for t in res if t]
+
+
+def candidates():
+    """
+    Every lowercase word WordNet finds synsets for: the lemma names, the
+    irregular forms of the exception lists, and the lemmas inflected by each
+    morphological rule that `wordnet.synsets` undoes with one substitution.
+    """
+    lemmas = set(wordnet.all_lemma_names())
+    forms = set(lemmas)
+    for exceptions in wordnet._exception_map.values():
+        forms.update(exceptions.keys())
+    substitutions = set([s for subs in wordnet.MORPHOLOGICAL_SUBSTITUTIONS.values() for s in subs])
+    for lemma in lemmas:
+        for old, new in substitutions:
+            if lemma.endswith(new):
+                forms.add(lemma[:len(lemma) - len(new)] + old)
+    return sorted([f for f in forms if re.match(r"[a-z]+$", f)])
+
+
+def build(path=TABLE_FILE):
+    """
+    Writes the synonyms of every candidate word to `path`. Synonym lists are
+    stored once and words point to them by index, since the inflections of a
+    lemma mostly share the same list.
+    """
+    st = timer()
+    lists, list_idx, index = [], {}, {}
+    for tk in candidates():
+        syns = sorted(wordnet_lookup(tk))
+        if not syns:
+            continue
+        key = "\t".join(syns)
+        if key not in list_idx:
+            list_idx[key] = len(lists)
+            lists.append(syns)
+        index[tk] = list_idx[key]
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"version": FORMAT_VERSION, "wordnet": wordnet.get_version(), "synonyms": lists, "index": index}, f,
+                  separators=(",", ":"))
+    os.replace(tmp, path)
+    logging.info(f"Built {len(index)} words, {len(lists)} synonym lists to {path} in {timer() - st:.1f}s")
+
+
+def load(path=TABLE_FILE):
+    """Returns {word: [synonyms]}, or None if the table has not been built."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            d = json.load(f)
+        if d.get("version") != FORMAT_VERSION:
+            logging.warning(f"{path} has version {d.get('version')}, expected {FORMAT_VERSION}")
+            return None
+        lists = [tuple(syns) for syns in d["synonyms"]]
+        return {tk: lists[i] for tk, i in d["index"].items()}
+    except Exception as e:
+        logging.warning(f"Fail to load {path}: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    # python rag/nlp/wordnet_synonym.py [rag/res/wordnet_synonym.json]
+    logging.basicConfig(level=logging.INFO)
+    build(sys.argv[1] if len(sys.argv) > 1 else TABLE_FILE)
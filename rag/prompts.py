@@ -25,7 +25,7 @@ from api.db.services.document_service import DocumentService
 from api.db.services.llm_service import TenantLLMService, LLMBundle
 from api.utils.file_utils import get_project_base_directory
 from rag.settings import TAG_FLD
-from rag.utils import num_tokens_from_string, encoder
+from rag.utils import num_tokens_from_string, num_tokens_from_strings, truncate
 
 
 def chunks_format(reference):
@@ -82,12 +82,12 @@ def message_fit_in(msg, max_length=4000):
     ll2 = num_tokens_from_string(msg_[-1]["content"])
     if ll / (ll + ll2) > 0.8:
         m = msg_[0]["content"]
-        m = encoder.decode(encoder.encode(m)[:max_length - ll2])
+        m = truncate(m, max_length - ll2)
         msg[0]["content"] = m
         return max_length, msg
 
     m = msg_[1]["content"]
-    m = encoder.decode(encoder.encode(m)[:max_length - ll2])
+    m = truncate(m, max_length - ll2)
     msg[1]["content"] = m
     return max_length, msg
 
@@ -96,8 +96,8 @@ def kb_prompt(kbinfos, max_tokens):
     knowledges = [ck["content_with_weight"] for ck in kbinfos["chunks"]]
     used_token_count = 0
     chunks_num = 0
-    for i, c in enumerate(knowledges):
-        used_token_count += num_tokens_from_string(c)
+    for i, c in enumerate(num_tokens_from_strings(knowledges)):
+        used_token_count += c
         chunks_num += 1
         if max_tokens * 0.97 < used_token_count:
             knowledges = knowledges[:i]
@@ -41,6 +41,8 @@ SVR_CONSUMER_NAME = "rag_flow_svr_consumer"
 SVR_CONSUMER_GROUP_NAME = "rag_flow_svr_consumer_group"
 PAGERANK_FLD = "pagerank_fea"
 TAG_FLD = "tag_feas"
+# cosine similarity of a hit to the query vector, computed by the doc store when selected
+VECTOR_SIMILARITY_FLD = "_vector_similarity"
 
 
 def print_rag_settings():
@@ -0,0 +1,87 @@
+#
+#  Copyright 2025 The InfiniFlow Authors. All Rights Reserved.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+
+import os
+import sys
+
+sys.path.insert(
+    0,
+    os.path.abspath(
+        os.path.join(
+            os.path.dirname(
+                os.path.abspath(__file__)),
+            '../../')))
+
+import argparse
+import re
+import subprocess
+
+FIRST_PARTY = ("api", "rag", "deepdoc", "graphrag", "agent", "agentic_reasoning")
+
+
+def import_times(module):
+    """
+    Imports `module` in a fresh interpreter under `-X importtime` and returns
+    [(name, depth, self us, cumulative us)], in the order the imports finished.
+    """
+    base = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../'))
+    env = dict(os.environ, PYTHONPATH=base + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=base, env=env, capture_output=True, text=True)
+    res = []
+    for line in proc.stderr.split("\n"):
+        m = re.match(r"import time:\s+([0-9]+) \|\s+([0-9]+) \|( *)(\S+)", line)
+        if m:
+            res.append((m.group(4), len(m.group(3)) // 2, int(m.group(1)), int(m.group(2))))
+    if proc.returncode != 0:
+        print(f"import {module} failed:\n" + "\n".join(proc.stderr.strip().split("\n")[-3:]))
+    return res
+
+
+def main(args):
+    for module in args.modules.split(","):
+        times = import_times(module)
+        if not times:
+            continue
+        total = sum([s for _, _, s, _ in times])
+        print(f"{module}: {total / 1e6:.2f}s, {len(times)} modules")
+
+        # a third party package costs its cumulative time when first imported
+        packages = {}
+        for name, _, _, cumulative in times:
+            top = name.split(".")[0]
+            if top in FIRST_PARTY or top in packages:
+                continue
+            if name == top:
+                packages[top] = cumulative
+        print("  heaviest third party packages:")
+        for top, us in sorted(packages.items(), key=lambda x: x[1] * -1)[:args.top]:
+            print(f"    {us / 1e6:8.3f}s  {top}")
+
+        # first party modules by the time of their own body, e.g. models loaded at import
+        own = [(name, s) for name, _, s, _ in times if name.split(".")[0] in FIRST_PARTY]
+        print("  slowest first party module bodies:")
+        for name, us in sorted(own, key=lambda x: x[1] * -1)[:args.top]:
+            print(f"    {us / 1e6:8.3f}s  {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modules', help="Comma separated modules to import. Default: rag.svr.task_executor",
+                        default="rag.svr.task_executor")
+    parser.add_argument('--top', help="Number of entries to print. Default: 15", type=int, default=15)
+    args = parser.parse_args()
+    main(args)
@@ -20,9 +20,6 @@ import random
 import sys
 
 from api.utils.log_utils import initRootLogger, get_project_base_directory
-from graphrag.general.index import WithCommunity, WithResolution, Dealer
-from graphrag.light.graph_extractor import GraphExtractor as LightKGExt
-from graphrag.general.graph_extractor import GraphExtractor as GeneralKGExt
 from graphrag.utils import get_llm_cache, set_llm_cache, get_tags_from_cache, set_tags_to_cache
 from rag.prompts import keyword_extraction, question_proposal, content_tagging
 
@@ -36,6 +33,7 @@ from datetime import datetime
 import json
 import xxhash
 import copy
+import importlib
 import re
 from functools import partial
 from io import BytesIO
@@ -58,10 +56,8 @@ from api import settings
 from api.utils import current_timestamp
 from api.versions import get_ragflow_version
 from api.db.db_models import close_connection
-from rag.app import laws, paper, presentation, manual, qa, table, book, resume, picture, naive, one, audio, \
-    email, tag
+from api.validation import resource_validation
 from rag.nlp import search, rag_tokenizer
-from rag.raptor import RecursiveAbstractiveProcessing4TreeOrganizedRetrieval as Raptor
 from rag.settings import DOC_MAXIMUM_SIZE, SVR_QUEUE_NAME, print_rag_settings, TAG_FLD, PAGERANK_FLD
 from rag.utils import num_tokens_from_string
 from rag.utils.redis_conn import REDIS_CONN
@@ -70,23 +66,24 @@ from graphrag.utils import chat_limiter
 
 BATCH_SIZE = 64
 
+# chunkers under rag.app, imported on first use since each pulls in its own parsers and models
 FACTORY = {
-    "general": naive,
-    ParserType.NAIVE.value: naive,
-    ParserType.PAPER.value: paper,
-    ParserType.BOOK.value: book,
-    ParserType.PRESENTATION.value: presentation,
-    ParserType.MANUAL.value: manual,
-    ParserType.LAWS.value: laws,
-    ParserType.QA.value: qa,
-    ParserType.TABLE.value: table,
-    ParserType.RESUME.value: resume,
-    ParserType.PICTURE.value: picture,
-    ParserType.ONE.value: one,
-    ParserType.AUDIO.value: audio,
-    ParserType.EMAIL.value: email,
-    ParserType.KG.value: naive,
-    ParserType.TAG.value: tag
+    "general": "naive",
+    ParserType.NAIVE.value: "naive",
+    ParserType.PAPER.value: "paper",
+    ParserType.BOOK.value: "book",
+    ParserType.PRESENTATION.value: "presentation",
+    ParserType.MANUAL.value: "manual",
+    ParserType.LAWS.value: "laws",
+    ParserType.QA.value: "qa",
+    ParserType.TABLE.value: "table",
+    ParserType.RESUME.value: "resume",
+    ParserType.PICTURE.value: "picture",
+    ParserType.ONE.value: "one",
+    ParserType.AUDIO.value: "audio",
+    ParserType.EMAIL.value: "email",
+    ParserType.KG.value: "naive",
+    ParserType.TAG.value: "tag"
 }
 
 UNACKED_ITERATOR = None
@@ -104,8 +101,6 @@ MAX_CONCURRENT_CHUNK_BUILDERS = int(os.environ.get('MAX_CONCURRENT_CHUNK_BUILDER
 task_limiter = trio.CapacityLimiter(MAX_CONCURRENT_TASKS)
 chunk_limiter = trio.CapacityLimiter(MAX_CONCURRENT_CHUNK_BUILDERS)
 
-import nltk
-nltk.download('punkt')
 
 def write_debug_log(message: str):
     """
@@ -254,7 +249,8 @@ async def build_chunks(task, progress_callback):
         return []
 
     # 根据解析器类型获取对应的处理函数
-    chunker = FACTORY[task["parser_id"].lower()]
+    # the first import of a chunker loads its models, keep it off the event loop
+    chunker = await trio.to_thread.run_sync(importlib.import_module, "rag.app." + FACTORY[task["parser_id"].lower()])
     try:
         # 从存储中获取文件内容
         st = timer()
@@ -283,6 +279,7 @@ async def build_chunks(task, progress_callback):
                                 to_page=task["to_page"], lang=task["language"], callback=progress_callback,
                                 kb_id=task["kb_id"], parser_config=task["parser_config"], tenant_id=task["tenant_id"]))
         logging.info("Chunking({}) {}/{} done".format(timer() - st, task["location"], task["name"]))
+        logging.info("Tokenizer cache: {}".format(rag_tokenizer.cache_info()))
     except TaskCanceledException:
         raise
     except Exception as e:
@@ -512,11 +509,13 @@ async def run_raptor(row, chat_mdl, embd_mdl, vector_size, callback=None):
         res: 处理结果
         tk_count: token数量
     """
+    from rag.raptor import RecursiveAbstractiveProcessing4TreeOrganizedRetrieval as Raptor
+
     chunks = []
     vctr_nm = "q_%d_vec"%vector_size
     # 获取文档块列表
-    for d in settings.retrievaler.chunk_list(row["doc_id"], row["tenant_id"], [str(row["kb_id"])],
-                                             fields=["content_with_weight", vctr_nm]):
+    for d in settings.retrievaler.iter_chunks(row["doc_id"], row["tenant_id"], [str(row["kb_id"])],
+                                              fields=["content_with_weight", vctr_nm]):
         chunks.append((d["content_with_weight"], np.array(d[vctr_nm])))
 
     # 初始化RAPTOR
@@ -566,10 +565,14 @@ async def run_graphrag(row, chat_model, language, embedding_model, callback=None
         embedding_model: 嵌入模型
         callback: 回调函数
     """
+    from graphrag.general.index import Dealer
+    from graphrag.light.graph_extractor import GraphExtractor as LightKGExt
+    from graphrag.general.graph_extractor import GraphExtractor as GeneralKGExt
+
     chunks = []
     # 获取文档块列表
-    for d in settings.retrievaler.chunk_list(row["doc_id"], row["tenant_id"], [str(row["kb_id"])],
-                                             fields=["content_with_weight", "doc_id"]):
+    for d in settings.retrievaler.iter_chunks(row["doc_id"], row["tenant_id"], [str(row["kb_id"])],
+                                              fields=["content_with_weight", "doc_id"]):
         chunks.append((d["doc_id"], d["content_with_weight"]))
 
     # 初始化图RAG处理器
@@ -663,6 +666,7 @@ async def do_handle_task(task):
         graphrag_conf = task_parser_config.get("graphrag", {})
         if not graphrag_conf.get("use_graphrag", False):
             return
+        from graphrag.general.index import WithCommunity, WithResolution
         start_ts = timer()
         chat_model = LLMBundle(task_tenant_id, LLMType.CHAT, llm_name=task_llm_id, lang=task_language)
         await run_graphrag(task, chat_model, task_language, embedding_model, progress_callback)
@@ -817,6 +821,7 @@ async def main():
     logging.info(f'TaskExecutor: RAGFlow version: {get_ragflow_version()}')
     settings.init_settings()
     print_rag_settings()
+    resource_validation()
     signal.signal(signal.SIGUSR1, start_tracemalloc_and_snapshot)
     signal.signal(signal.SIGUSR2, stop_tracemalloc)
     TRACE_MALLOC_ENABLED = int(os.environ.get('TRACE_MALLOC_ENABLED', "0"))
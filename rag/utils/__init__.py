@@ -16,7 +16,11 @@
 
 import os
 import re
+import threading
+from collections import OrderedDict
+
 import tiktoken
+import xxhash
 from api.utils.file_utils import get_project_base_directory
 
 def singleton(cls, *args, **kw):
@@ -78,14 +82,91 @@ os.environ["TIKTOKEN_CACHE_DIR"] = tiktoken_cache_dir
 encoder = tiktoken.get_encoding("cl100k_base")
 
 
+TOKEN_COUNT_CACHE_SIZE = int(os.environ.get("TOKEN_COUNT_CACHE_SIZE", "65536"))
+TOKEN_COUNT_THREADS = int(os.environ.get("TOKEN_COUNT_THREADS", "8"))
+# token counts by the hash of the content, so cached texts are not kept alive
+_token_counts = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+def _token_count_key(string):
+    return xxhash.xxh3_128_intdigest(string.encode("utf-8", "surrogatepass"))
+
+
+def _cached_token_count(key):
+    with _token_counts_lock:
+        if key not in _token_counts:
+            return None
+        _token_counts.move_to_end(key)
+        return _token_counts[key]
+
+
+def _cache_token_count(key, count):
+    with _token_counts_lock:
+        _token_counts[key] = count
+        _token_counts.move_to_end(key)
+        while len(_token_counts) > TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+
+
 def num_tokens_from_string(string: str) -> int:
     """Returns the number of tokens in a text string."""
     try:
-        return len(encoder.encode(string))
+        key = _token_count_key(string)
+        n = _cached_token_count(key)
+        if n is None:
+            n = len(encoder.encode(string))
+            _cache_token_count(key, n)
+        return n
     except Exception:
         return 0
 
 
+def num_tokens_from_strings(strings: list[str], num_threads: int = TOKEN_COUNT_THREADS) -> list[int]:
+    """Returns the number of tokens of each string, encoding the uncached ones in parallel."""
+    res, keys, misses = [0] * len(strings), [None] * len(strings), {}
+    for i, string in enumerate(strings):
+        try:
+            keys[i] = _token_count_key(string)
+        except Exception:
+            continue
+        n = _cached_token_count(keys[i])
+        if n is None:
+            misses.setdefault(keys[i], []).append(i)
+        else:
+            res[i] = n
+    if not misses:
+        return res
+    idx = [ii[0] for ii in misses.values()]
+    try:
+        counts = [len(tks) for tks in encoder.encode_batch([strings[i] for i in idx], num_threads=num_threads)]
+    except Exception:
+        # one string with special tokens fails the batch, count them one by one as num_tokens_from_string does
+        counts = [num_tokens_from_string(strings[i]) for i in idx]
+    for (key, ii), n in zip(misses.items(), counts):
+        _cache_token_count(key, n)
+        for i in ii:
+            res[i] = n
+    return res
+
+
+# Places where the cl100k_base pattern always starts a new piece: a space
+# after a non-space, or a line break after a letter or digit.
+_TOKEN_PIECE_START = re.compile(r"(?<=\S) |(?<=[^\W_])\n")
+
+
 def truncate(string: str, max_len: int) -> str:
     """Returns truncated text if the length of text exceed max_len."""
+    # Encode a growing prefix cut at a piece start instead of the whole text,
+    # the tokens of such a prefix are a prefix of the tokens of the text.
+    # A negative max_len drops tokens from the end, which needs them all.
+    n = max_len * 8 if max_len > 0 else len(string)
+    while n < len(string):
+        m = _TOKEN_PIECE_START.search(string, n)
+        if not m:
+            break
+        tks = encoder.encode(string[:m.start()])
+        if len(tks) > max_len:
+            return encoder.decode(tks[:max_len])
+        n = m.start() * 2
     return encoder.decode(encoder.encode(string)[:max_len])
@@ -14,10 +14,18 @@
 #  limitations under the License.
 #
 
+import functools
+import inspect
+import os
+import time
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 import numpy as np
 
+# seconds after a write during which the store may not show it yet, e.g. until
+# Elasticsearch refreshes the index
+KB_VERSION_SETTLE = float(os.environ.get("KB_VERSION_SETTLE", "5"))
+
 DEFAULT_MATCH_VECTOR_TOPN = 10
 DEFAULT_MATCH_SPARSE_TOPN = 10
 VEC = list | np.ndarray
@@ -141,6 +149,54 @@ class OrderByExpr(ABC):
     def fields(self):
         return self.fields
 
+
+def bump_kb_version(func):
+    """
+    Decorates the write methods of a DocStoreConnection, insert, update,
+    delete and deleteIdx, to increment the version of the knowledge bases they
+    touch once they return. The version of the whole index is incremented
+    instead when the knowledge bases are unknown. Caches of search results,
+    like the retrieval cache of rag.nlp.search.Dealer, compare the versions
+    to tell whether a result predates a change.
+    """
+    sig = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            arguments = sig.bind(*args, **kwargs).arguments
+            kb_ids = set()
+            for v in [arguments.get("knowledgebaseId"), (arguments.get("condition") or {}).get("kb_id")] + \
+                     [d.get("kb_id") for d in arguments.get("documents") or []]:
+                kb_ids.update(v if isinstance(v, list) else [v] if v else [])
+            incr_kb_versions([f"kb:{kb_id}" for kb_id in kb_ids] or [f"idx:{arguments.get('indexName')}"])
+
+    return wrapper
+
+
+def incr_kb_versions(names):
+    from rag.utils.redis_conn import REDIS_CONN
+    for nm in names:
+        REDIS_CONN.incr(f"kb_version:{nm}")
+        REDIS_CONN.set(f"kb_version_tm:{nm}", time.time(), int(KB_VERSION_SETTLE) + 1)
+
+
+def get_kb_versions(kb_ids, index_names):
+    """
+    Returns the versions of the knowledge bases and indices, and whether
+    none of them was written within KB_VERSION_SETTLE seconds. Returns
+    None, None without Redis, when no version can be trusted.
+    """
+    from rag.utils.redis_conn import REDIS_CONN
+    names = [f"kb:{kb_id}" for kb_id in kb_ids] + [f"idx:{nm}" for nm in index_names]
+    res = REDIS_CONN.mget([f"kb_version:{nm}" for nm in names] + [f"kb_version_tm:{nm}" for nm in names])
+    if res is None:
+        return None, None
+    return tuple(res[:len(names)]), all([tm is None for tm in res[len(names):]])
+
+
 class DocStoreConnection(ABC):
     """
     Database operations
@@ -185,6 +241,13 @@ class DocStoreConnection(ABC):
         """
         raise NotImplementedError("Not implemented")
 
+    @abstractmethod
+    def knowledgebaseIdsIn(self, indexName: str, knowledgebaseIds: list[str]) -> list[str]:
+        """
+        Returns those of knowledgebaseIds which are stored in the index
+        """
+        raise NotImplementedError("Not implemented")
+
     """
     CRUD operations
     """
@@ -208,6 +271,16 @@ class DocStoreConnection(ABC):
         """
         raise NotImplementedError("Not implemented")
 
+    @abstractmethod
+    def scan(self, selectFields: list[str], condition: dict, indexName: str, knowledgebaseIds: list[str],
+             batchSize: int = 1000):
+        """
+        Iterate over all rows matching the conjunctive equivalent filtering condition, batchSize rows per
+        request, as {"id": ..., field: value} in the form getFields returns. Each request resumes after the
+        last row returned instead of skipping an offset.
+        """
+        raise NotImplementedError("Not implemented")
+
     @abstractmethod
     def get(self, chunkId: str, indexName: str, knowledgebaseIds: list[str]) -> dict | None:
         """
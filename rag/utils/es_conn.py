@@ -25,15 +25,29 @@ from elasticsearch import Elasticsearch, NotFoundError
 from elasticsearch_dsl import UpdateByQuery, Q, Search, Index
 from elastic_transport import ConnectionTimeout
 from rag import settings
-from rag.settings import TAG_FLD, PAGERANK_FLD
+from rag.settings import TAG_FLD, PAGERANK_FLD, VECTOR_SIMILARITY_FLD
 from rag.utils import singleton
 from api.utils.file_utils import get_project_base_directory
 from rag.utils.doc_store_conn import DocStoreConnection, MatchExpr, OrderByExpr, MatchTextExpr, MatchDenseExpr, \
-    FusionExpr
+    FusionExpr, bump_kb_version
 from rag.nlp import is_english, rag_tokenizer
 
 ATTEMPT_TIME = 2
 
+# cosine similarity of the stored vector to params.qv, whose norm is params.qnorm
+VECTOR_SIMILARITY_SCRIPT = """
+if (doc[params.field].size() == 0) { return 0.0; }
+float[] v = doc[params.field].vectorValue;
+double dot = 0.0;
+double norm = 0.0;
+for (int i = 0; i < v.length; i++) {
+    double q = params.qv[i];
+    dot += v[i] * q;
+    norm += v[i] * v[i];
+}
+return norm == 0.0 ? 0.0 : dot / Math.sqrt(norm) / params.qnorm;
+"""
+
 logger = logging.getLogger('ragflow.es_conn')
 
 
@@ -102,6 +116,7 @@ class ESConnection(DocStoreConnection):
         except Exception:
             logger.exception("ESConnection.createIndex error %s" % (indexName))
 
+    @bump_kb_version
     def deleteIdx(self, indexName: str, knowledgebaseId: str):
         if len(knowledgebaseId) > 0:
             # The index need to be alive after any kb deletion since all kb under this tenant are in one index.
@@ -125,6 +140,24 @@ class ESConnection(DocStoreConnection):
                 break
         return False
 
+    def knowledgebaseIdsIn(self, indexName: str, knowledgebaseIds: list[str]) -> list[str]:
+        q = {"query": {"terms": {"kb_id": knowledgebaseIds}}, "size": 0,
+             "aggs": {"kb_ids": {"terms": {"field": "kb_id", "size": max(len(knowledgebaseIds), 1)}}}}
+        for i in range(ATTEMPT_TIME):
+            try:
+                res = self.es.search(index=indexName, body=q, track_total_hits=False)
+                found = set([b["key"] for b in res["aggregations"]["kb_ids"]["buckets"]])
+                return [kb_id for kb_id in knowledgebaseIds if kb_id in found]
+            except NotFoundError:
+                return []
+            except Exception as e:
+                logger.exception("ESConnection.knowledgebaseIdsIn got exception")
+                if str(e).find("Timeout") > 0:
+                    continue
+                raise e
+        logger.error("ESConnection.knowledgebaseIdsIn timeout for 3 times!")
+        raise Exception("ESConnection.knowledgebaseIdsIn timeout.")
+
     """
     CRUD operations
     """
@@ -150,25 +183,8 @@ class ESConnection(DocStoreConnection):
         assert isinstance(indexNames, list) and len(indexNames) > 0
         assert "_id" not in condition
 
-        bqry = Q("bool", must=[])
         condition["kb_id"] = knowledgebaseIds
-        for k, v in condition.items():
-            if k == "available_int":
-                if v == 0:
-                    bqry.filter.append(Q("range", available_int={"lt": 1}))
-                else:
-                    bqry.filter.append(
-                        Q("bool", must_not=Q("range", available_int={"lt": 1})))
-                continue
-            if not v:
-                continue
-            if isinstance(v, list):
-                bqry.filter.append(Q("terms", **{k: v}))
-            elif isinstance(v, str) or isinstance(v, int):
-                bqry.filter.append(Q("term", **{k: v}))
-            else:
-                raise Exception(
-                    f"Condition `{str(k)}={str(v)}` value type is {str(type(v))}, expected to be int, str or list.")
+        bqry = self._condition_query(condition)
 
         s = Search()
         vector_similarity_weight = 0.5
@@ -214,6 +230,17 @@ class ESConnection(DocStoreConnection):
         for field in highlightFields:
             s = s.highlight(field)
 
+        # the similarity replaces the vectors, which are then left out of the hits
+        source_excludes = None
+        dense = [m for m in matchExprs if isinstance(m, MatchDenseExpr)]
+        if VECTOR_SIMILARITY_FLD in selectFields and dense:
+            qv = [float(v) for v in dense[0].embedding_data]
+            s = s.script_fields(**{VECTOR_SIMILARITY_FLD: {"script": {
+                "source": VECTOR_SIMILARITY_SCRIPT,
+                "params": {"field": dense[0].vector_column_name, "qv": qv,
+                           "qnorm": max(sum([v * v for v in qv]) ** 0.5, 1e-12)}}}})
+            source_excludes = ["*_vec"]
+
         if orderBy:
             orders = list()
             for field, order in orderBy.fields:
@@ -244,7 +271,8 @@ class ESConnection(DocStoreConnection):
                                      timeout="600s",
                                      # search_type="dfs_query_then_fetch",
                                      track_total_hits=True,
-                                     _source=True)
+                                     _source=True,
+                                     _source_excludes=source_excludes)
                 if str(res.get("timed_out", "")).lower() == "true":
                     raise Exception("Es Timeout.")
                 logger.debug(f"ESConnection.search {str(indexNames)} res: " + str(res))
@@ -257,6 +285,82 @@ class ESConnection(DocStoreConnection):
         logger.error("ESConnection.search timeout for 3 times!")
         raise Exception("ESConnection.search timeout.")
 
+    @staticmethod
+    def _condition_query(condition: dict):
+        bqry = Q("bool", must=[])
+        for k, v in condition.items():
+            if k == "available_int":
+                if v == 0:
+                    bqry.filter.append(Q("range", available_int={"lt": 1}))
+                else:
+                    bqry.filter.append(
+                        Q("bool", must_not=Q("range", available_int={"lt": 1})))
+                continue
+            if not v:
+                continue
+            if k == "id":
+                bqry.filter.append(Q("ids", values=v if isinstance(v, list) else [v]))
+                continue
+            if isinstance(v, list):
+                bqry.filter.append(Q("terms", **{k: v}))
+            elif isinstance(v, str) or isinstance(v, int):
+                bqry.filter.append(Q("term", **{k: v}))
+            else:
+                raise Exception(
+                    f"Condition `{str(k)}={str(v)}` value type is {str(type(v))}, expected to be int, str or list.")
+        return bqry
+
+    def scan(self, selectFields: list[str], condition: dict, indexName: str, knowledgebaseIds: list[str],
+             batchSize: int = 1000):
+        """
+        Pages through a point in time of the index with search_after, so every
+        page costs the same however deep it is, and writes during the scan
+        don't shift the pages.
+        Refers to https://www.elastic.co/guide/en/elasticsearch/reference/current/paginate-search-results.html
+        """
+        assert "_id" not in condition
+        bqry = self._condition_query(dict(condition, kb_id=knowledgebaseIds))
+        pit = self.es.open_point_in_time(index=indexName, keep_alive="5m")["id"]
+        try:
+            search_after = None
+            while True:
+                q = {"query": bqry.to_dict(), "size": batchSize, "pit": {"id": pit, "keep_alive": "5m"},
+                     "sort": [{"_shard_doc": "asc"}], "_source": selectFields}
+                if search_after:
+                    q["search_after"] = search_after
+                res = self._scan_page(q, indexName)
+                pit = res.get("pit_id", pit)
+                hits = res["hits"]["hits"]
+                for id, doc in self.getFields(res, selectFields).items():
+                    doc["id"] = id
+                    yield doc
+                if len(hits) < batchSize:
+                    break
+                search_after = hits[-1]["sort"]
+        finally:
+            try:
+                self.es.close_point_in_time(id=pit)
+            except Exception:
+                logger.warning(f"ESConnection.scan {indexName} fail to close point in time")
+
+    def _scan_page(self, q: dict, indexName: str):
+        for i in range(ATTEMPT_TIME):
+            try:
+                res = self.es.search(body=q, timeout="600s", track_total_hits=False)
+                if str(res.get("timed_out", "")).lower() == "true":
+                    raise Exception("Es Timeout.")
+                return res
+            except ConnectionTimeout:
+                logger.exception(f"ESConnection.scan {indexName} timeout")
+                continue
+            except Exception as e:
+                logger.exception(f"ESConnection.scan {indexName} got exception")
+                if str(e).find("Timeout") > 0:
+                    continue
+                raise e
+        logger.error("ESConnection.scan timeout for 3 times!")
+        raise Exception("ESConnection.scan timeout.")
+
     def get(self, chunkId: str, indexName: str, knowledgebaseIds: list[str]) -> dict | None:
         for i in range(ATTEMPT_TIME):
             try:
@@ -277,6 +381,7 @@ class ESConnection(DocStoreConnection):
         logger.error("ESConnection.get timeout for 3 times!")
         raise Exception("ESConnection.get timeout.")
 
+    @bump_kb_version
     def insert(self, documents: list[dict], indexName: str, knowledgebaseId: str = None) -> list[str]:
         # Refers to https://www.elastic.co/guide/en/elasticsearch/reference/current/docs-bulk.html
         operations = []
@@ -313,6 +418,7 @@ class ESConnection(DocStoreConnection):
                     continue
         return res
 
+    @bump_kb_version
     def update(self, condition: dict, newValue: dict, indexName: str, knowledgebaseId: str) -> bool:
         doc = copy.deepcopy(newValue)
         doc.pop("id", None)
@@ -396,6 +502,7 @@ class ESConnection(DocStoreConnection):
                 break
         return False
 
+    @bump_kb_version
     def delete(self, condition: dict, indexName: str, knowledgebaseId: str) -> int:
         qry = None
         assert "_id" not in condition
@@ -457,6 +564,8 @@ class ESConnection(DocStoreConnection):
         for d in res["hits"]["hits"]:
             d["_source"]["id"] = d["_id"]
             d["_source"]["_score"] = d["_score"]
+            if VECTOR_SIMILARITY_FLD in d.get("fields", {}):
+                d["_source"][VECTOR_SIMILARITY_FLD] = d["fields"][VECTOR_SIMILARITY_FLD][0]
             rr.append(d["_source"])
         return rr
 
@@ -470,6 +579,9 @@ class ESConnection(DocStoreConnection):
                 if isinstance(v, list):
                     m[n] = v
                     continue
+                # rank features, e.g. TAG_FLD, stay a {feature: score} dict
+                if isinstance(v, dict) and n.endswith("_feas"):
+                    continue
                 if not isinstance(v, str):
                     m[n] = str(m[n])
                 # if n.find("tks") > 0:
@@ -26,8 +26,9 @@ from infinity.index import IndexInfo, IndexType
 from infinity.connection_pool import ConnectionPool
 from infinity.errors import ErrorCode
 from rag import settings
-from rag.settings import PAGERANK_FLD
+from rag.settings import PAGERANK_FLD, VECTOR_SIMILARITY_FLD
 from rag.utils import singleton
+import numpy as np
 import pandas as pd
 from api.utils.file_utils import get_project_base_directory
 
@@ -38,6 +39,7 @@ from rag.utils.doc_store_conn import (
     MatchDenseExpr,
     FusionExpr,
     OrderByExpr,
+    bump_kb_version,
 )
 
 logger = logging.getLogger('ragflow.infinity_conn')
@@ -244,6 +246,7 @@ class InfinityConnection(DocStoreConnection):
             f"INFINITY created table {table_name}, vector size {vectorSize}"
         )
 
+    @bump_kb_version
     def deleteIdx(self, indexName: str, knowledgebaseId: str):
         table_name = f"{indexName}_{knowledgebaseId}"
         inf_conn = self.connPool.get_conn()
@@ -264,6 +267,10 @@ class InfinityConnection(DocStoreConnection):
             logger.warning(f"INFINITY indexExist {str(e)}")
         return False
 
+    def knowledgebaseIdsIn(self, indexName: str, knowledgebaseIds: list[str]) -> list[str]:
+        # every knowledge base has its own table in the index
+        return [kb_id for kb_id in knowledgebaseIds if self.indexExist(indexName, kb_id)]
+
     """
     CRUD operations
     """
@@ -314,6 +321,16 @@ class InfinityConnection(DocStoreConnection):
             if PAGERANK_FLD not in output:
                 output.append(PAGERANK_FLD)
         output = [f for f in output if f != "_score"]
+        # Infinity has no per-hit similarity under fusion, so the vectors are
+        # fetched and the similarity is computed here instead
+        dense = [m for m in matchExprs if isinstance(m, MatchDenseExpr)]
+        vector_similarity = None
+        if VECTOR_SIMILARITY_FLD in output:
+            output.remove(VECTOR_SIMILARITY_FLD)
+            if dense:
+                vector_similarity = dense[0]
+                if vector_similarity.vector_column_name not in output:
+                    output.append(vector_similarity.vector_column_name)
 
         # Prepare expressions common to all tables
         filter_cond = None
@@ -413,9 +430,56 @@ class InfinityConnection(DocStoreConnection):
             res['Sum'] = res[score_column] + res[PAGERANK_FLD]
             res = res.sort_values(by='Sum', ascending=False).reset_index(drop=True).drop(columns=['Sum'])
             res = res.head(limit)
+        if vector_similarity:
+            col = vector_similarity.vector_column_name
+            q = np.array(vector_similarity.embedding_data, dtype=np.float64)
+            vecs = np.array([np.asarray(v, dtype=np.float64) for v in res[col]]).reshape(len(res), len(q))
+            norms = np.linalg.norm(vecs, axis=1) * np.linalg.norm(q)
+            res[VECTOR_SIMILARITY_FLD] = np.divide(vecs @ q, norms, out=np.zeros(len(res)), where=norms > 0)
+            if col not in selectFields:
+                res = res.drop(columns=[col])
         logger.debug(f"INFINITY search final result: {str(res)}")
         return res, total_hits_count
 
+    def scan(self, selectFields: list[str], condition: dict, indexName: str, knowledgebaseIds: list[str],
+             batchSize: int = 1000):
+        """
+        Pages through each table of the knowledge bases in the order of id,
+        every page filtered to the ids after the last one returned.
+        """
+        output = selectFields.copy()
+        if "id" not in output:
+            output.append("id")
+        for knowledgebaseId in knowledgebaseIds:
+            table_name = f"{indexName}_{knowledgebaseId}"
+            inf_conn = self.connPool.get_conn()
+            try:
+                table_instance = inf_conn.get_database(self.dbName).get_table(table_name)
+                filter_cond = equivalent_condition_to_str(condition, table_instance)
+            except Exception:
+                self.connPool.release_conn(inf_conn)
+                continue
+            self.connPool.release_conn(inf_conn)
+            last_id = None
+            while True:
+                cond = [c for c in [filter_cond, "id > '{}'".format(last_id) if last_id is not None else ""] if c]
+                inf_conn = self.connPool.get_conn()
+                try:
+                    builder = inf_conn.get_database(self.dbName).get_table(table_name).output(output)
+                    if cond:
+                        builder.filter(" AND ".join([f"({c})" for c in cond]))
+                    builder.sort([("id", SortType.Asc)])
+                    res, _ = builder.limit(batchSize).to_df()
+                finally:
+                    self.connPool.release_conn(inf_conn)
+                logger.debug(f"INFINITY scan table: {table_name}, after: {last_id}, rows: {len(res)}")
+                for id, doc in self.getFields(res, selectFields).items():
+                    doc["id"] = id
+                    yield doc
+                if len(res) < batchSize:
+                    break
+                last_id = res["id"].iloc[-1]
+
     def get(
             self, chunkId: str, indexName: str, knowledgebaseIds: list[str]
     ) -> dict | None:
@@ -442,6 +506,7 @@ class InfinityConnection(DocStoreConnection):
         res_fields = self.getFields(res, res.columns.tolist())
         return res_fields.get(chunkId, None)
 
+    @bump_kb_version
     def insert(
             self, documents: list[dict], indexName: str, knowledgebaseId: str = None
     ) -> list[str]:
@@ -512,6 +577,7 @@ class InfinityConnection(DocStoreConnection):
         logger.debug(f"INFINITY inserted into {table_name} {str_ids}.")
         return []
 
+    @bump_kb_version
     def update(
             self, condition: dict, newValue: dict, indexName: str, knowledgebaseId: str
     ) -> bool:
@@ -552,6 +618,7 @@ class InfinityConnection(DocStoreConnection):
         self.connPool.release_conn(inf_conn)
         return True
 
+    @bump_kb_version
     def delete(self, condition: dict, indexName: str, knowledgebaseId: str) -> int:
         inf_conn = self.connPool.get_conn()
         db_instance = inf_conn.get_database(self.dbName)
@@ -591,6 +658,12 @@ class InfinityConnection(DocStoreConnection):
         fieldsAll = fields.copy()
         fieldsAll.append('id')
         column_map = {col.lower(): col for col in res.columns}
+        # the score of a hit, as _score is in Elasticsearch
+        if "_score" in fieldsAll and "_score" not in column_map:
+            for col in ["score", "similarity"]:
+                if col in column_map:
+                    column_map["_score"] = column_map[col]
+                    break
         matched_columns = {column_map[col.lower()]:col for col in set(fieldsAll) if col.lower() in column_map}
         none_columns = [col for col in set(fieldsAll) if col.lower() not in column_map]
 
@@ -613,6 +686,14 @@ class InfinityConnection(DocStoreConnection):
                 res2[column] = res2[column].apply(to_position_int)
             elif k in ["page_num_int", "top_int"]:
                 res2[column] = res2[column].apply(lambda v:[int(hex_val, 16) for hex_val in v.split('_')] if v else [])
+            elif re.search(r"_feas$", k):
+                def to_features(v):
+                    # rank features are stored as JSON, see insert
+                    try:
+                        return json.loads(v) if v else {}
+                    except ValueError:
+                        return v
+                res2[column] = res2[column].apply(to_features)
             else:
                 pass
         for column in none_columns:
@@ -114,6 +114,31 @@ class RedisDB:
             self.__open__()
         return False
 
+    def delete(self, k):
+        try:
+            self.REDIS.delete(k)
+            return True
+        except Exception as e:
+            logging.warning("RedisDB.delete " + str(k) + " got exception: " + str(e))
+            self.__open__()
+        return False
+
+    def incr(self, k):
+        try:
+            return self.REDIS.incr(k)
+        except Exception as e:
+            logging.warning("RedisDB.incr " + str(k) + " got exception: " + str(e))
+            self.__open__()
+
+    def mget(self, keys):
+        if not self.REDIS:
+            return
+        try:
+            return self.REDIS.mget(keys)
+        except Exception as e:
+            logging.warning("RedisDB.mget " + str(keys) + " got exception: " + str(e))
+            self.__open__()
+
     def sadd(self, key: str, member: str):
         try:
             self.REDIS.sadd(key, member)